@@ -54,6 +54,7 @@ import re
 import time
 import inspect
 import keyword
+import multiprocessing
 import tokenize
 from optparse import OptionParser
 from fnmatch import fnmatch
@@ -1204,6 +1205,22 @@ def init_checks_registry():
 init_checks_registry()
 
 
+def compile_check(check, argument_names):
+    """Compile a dispatcher which runs a check on a checker.
+
+    The dispatcher reads the arguments as plain attributes of the checker
+    passed to it, instead of collecting them with getattr on every line.
+    """
+    arguments = ', '.join('checker.' + name for name in argument_names)
+    return eval('lambda checker: check(%s)' % arguments, {'check': check})
+
+
+def compile_checks(checks):
+    """Compile the dispatchers of (name, check, argument_names) checks."""
+    return [(name, check, compile_check(check, argument_names))
+            for name, check, argument_names in checks]
+
+
 class Checker(object):
     """Load a Python source file, tokenize it, check coding style."""
 
@@ -1214,8 +1231,8 @@ class Checker(object):
         else:
             assert not kwargs
         self._io_error = None
-        self._physical_checks = options.physical_checks
-        self._logical_checks = options.logical_checks
+        self._physical_checks = options.physical_dispatch
+        self._logical_checks = options.logical_dispatch
         self._ast_checks = options.ast_checks
         self.max_line_length = options.max_line_length
         self.multiline = False  # in a multiline string?
@@ -1280,8 +1297,8 @@ class Checker(object):
     def check_physical(self, line):
         """Run all physical checks on a raw input line."""
         self.physical_line = line
-        for name, check, argument_names in self._physical_checks:
-            result = self.run_check(check, argument_names)
+        for name, check, dispatch in self._physical_checks:
+            result = dispatch(self)
             if result is not None:
                 (offset, text) = result
                 self.report_error(self.line_number, offset, text, check)
@@ -1332,10 +1349,10 @@ class Checker(object):
             self.blank_before = self.blank_lines
         if self.verbose >= 2:
             print(self.logical_line[:80].rstrip())
-        for name, check, argument_names in self._logical_checks:
+        for name, check, dispatch in self._logical_checks:
             if self.verbose >= 4:
                 print('   ' + name)
-            for offset, text in self.run_check(check, argument_names) or ():
+            for offset, text in dispatch(self) or ():
                 if not isinstance(offset, tuple):
                     for token_offset, pos in mapping:
                         if offset <= token_offset:
@@ -1457,6 +1474,253 @@ class Checker(object):
         return self.report.get_file_results()
 
 
+class _CheckerRun(object):
+    """Errors and logical lines of a checker run, in emission order."""
+
+    def __init__(self, lines):
+        self.lines = list(lines)
+        self.ast_errors = []
+        self.errors = []
+        self.logical_lines = 0
+        # Restart points: (row, dedents, state, errors, logical lines)
+        self.points = []
+        self.valid = True
+
+    def init_file(self, filename, lines, expected, line_offset):
+        self.lines = lines
+
+    def error(self, line_number, offset, text, check):
+        self.errors.append((line_number, offset, text, check))
+
+    def increment_logical_line(self):
+        self.logical_lines += 1
+
+    def get_file_results(self):
+        return len(self.errors)
+
+
+class IncrementalChecker(Checker):
+    """Check a file, re-checking only the lines changed since last run.
+
+    A run records restart points: lines starting a top level statement,
+    where the tokenizer keeps no state besides the pending dedents.  The
+    checker state, the errors and the logical lines counted so far are
+    saved for each of them.  The next run compares the lines with the
+    previous ones, replays the results up to the last restart point before
+    the first changed line and tokenizes from there.  It stops at the first
+    restart point past the last changed line with the same checker state,
+    and replays the remaining results shifted by the number of added lines.
+    """
+
+    def __init__(self, filename=None, lines=None,
+                 options=None, report=None, previous=None, **kwargs):
+        super(IncrementalChecker, self).__init__(
+            filename, lines, options, report, **kwargs)
+        self.previous = previous
+
+    def report_invalid_syntax(self):
+        """Check if the syntax is valid."""
+        self._run.valid = False
+        return super(IncrementalChecker, self).report_invalid_syntax()
+
+    def get_state(self):
+        """Return the checker state kept between logical lines."""
+        return (self.blank_lines, self.blank_before, self.previous_logical,
+                self.previous_indent_level, self.indent_level,
+                self.indent_char)
+
+    def set_state(self, state):
+        """Restore the checker state kept between logical lines."""
+        (self.blank_lines, self.blank_before, self.previous_logical,
+         self.previous_indent_level, self.indent_level,
+         self.indent_char) = state
+
+    def generate_tokens_from(self, row, dedents):
+        """Tokenize from the row on, as if following the previous lines.
+
+        Physical line checks are left to check_tokens, which runs them after
+        recording restart points.
+        """
+        self.line_number = offset = row - 1
+        for __ in range(dedents):
+            yield (tokenize.DEDENT, '', (row, 0), (row, 0), self.lines[offset])
+        tokengen = tokenize.generate_tokens(self.readline)
+        try:
+            for token in tokengen:
+                if offset:
+                    token = (token[0], token[1],
+                             (token[2][0] + offset, token[2][1]),
+                             (token[3][0] + offset, token[3][1]), token[4])
+                yield token
+        except (SyntaxError, tokenize.TokenError):
+            self.report_invalid_syntax()
+
+    def check_tokens(self, tokens, sync=None):
+        """Run the checks on tokens, return the point matched by sync."""
+        run = self._run
+        self.tokens = []
+        parens = 0
+        point = None
+        for token in tokens:
+            token_type, text, start = token[0:3]
+            if not start[1] and (token_type == tokenize.DEDENT or (
+                    not parens and token_type not in SKIP_COMMENTS and
+                    token_type != tokenize.ENDMARKER)):
+                if point is None and not self.tokens:
+                    point = [start[0], 0, self.get_state(),
+                             len(run.errors), run.logical_lines]
+                if point is not None:
+                    if token_type == tokenize.DEDENT:
+                        point[1] += 1
+                    else:
+                        point = tuple(point)
+                        run.points.append(point)
+                        matched = sync and sync(point)
+                        if matched:
+                            return matched
+                        point = None
+            self.maybe_check_physical(token)
+            self.tokens.append(token)
+            if token_type == tokenize.OP:
+                if text in '([{':
+                    parens += 1
+                elif text in '}])':
+                    parens -= 1
+            elif not parens and token_type in NEWLINE:
+                if token_type == tokenize.NEWLINE:
+                    self.check_logical()
+                    self.blank_before = 0
+                elif len(self.tokens) == 1:
+                    # The physical line contains only this token.
+                    self.blank_lines += 1
+                    del self.tokens[0]
+                else:
+                    self.check_logical()
+        if len(self.tokens) > 1 and (token_type == tokenize.ENDMARKER and
+                                     self.tokens[-2][0] not in SKIP_TOKENS):
+            self.tokens.pop()
+            self.check_physical(self.tokens[-1][4])
+            self.check_logical()
+
+    def start_run(self):
+        """Record the results of a new run, AST checks are run first."""
+        run = self._run = self.report = _CheckerRun(self.lines)
+        self.report_error = run.error
+        if self._ast_checks:
+            self.check_ast()
+        run.ast_errors, run.errors = run.errors, []
+        return run
+
+    def check_full(self):
+        """Run all checks on the whole file, recording restart points."""
+        self.start_run()
+        if self._io_error:
+            self.report_error(1, 0, 'E902 %s' % self._io_error, readlines)
+            self._run.valid = False
+        self.indent_char = None
+        self.indent_level = self.previous_indent_level = 0
+        self.previous_logical = ''
+        self.blank_lines = self.blank_before = 0
+        self.check_tokens(self.generate_tokens_from(1, 0))
+
+    def check_changes(self):
+        """Re-check the lines changed since the previous run.
+
+        Return False if the previous results can't be reused.
+        """
+        previous = self.previous
+        if previous is None or not previous.valid or self._io_error:
+            return False
+        old, new = previous.lines, self.lines
+        if old == new:
+            run = self._run = _CheckerRun(new)
+            run.ast_errors = previous.ast_errors
+            run.errors = previous.errors
+            run.logical_lines = previous.logical_lines
+            run.points = previous.points
+            return True
+
+        # Common prefix and suffix of the old and the new lines
+        size = min(len(old), len(new))
+        prefix = 0
+        while prefix < size and old[prefix] == new[prefix]:
+            prefix += 1
+        suffix = 0
+        while (suffix < size - prefix and
+               old[-1 - suffix] == new[-1 - suffix]):
+            suffix += 1
+        delta = len(new) - len(old)
+
+        # Restart from the last point before the first changed line
+        start = None
+        for point in previous.points:
+            if point[0] > prefix:
+                break
+            start = point
+        if start is None:
+            return False
+        (row, dedents, state, errors, logical_lines) = start
+        run = self.start_run()
+        run.errors = previous.errors[:errors]
+        run.logical_lines = logical_lines
+        run.points = [p for p in previous.points if p[0] < row]
+
+        # Stop at a point past the last changed line with the same state
+        old_points = dict((p[0], p) for p in previous.points)
+
+        def sync(point):
+            new_row = point[0]
+            if (new_row <= len(new) - suffix or
+                    min(new_row, new_row - delta) < 3):
+                return None
+            old_point = old_points.get(new_row - delta)
+            if old_point and old_point[1:3] == point[1:3]:
+                return old_point
+            return None
+
+        self.set_state(state)
+        matched = self.check_tokens(
+            self.generate_tokens_from(row, dedents), sync)
+        if not run.valid:
+            return False
+        if matched:
+            # Replay the rest of the previous run, shifted by delta
+            point = run.points.pop()
+            for (line_number, offset, text,
+                 check) in previous.errors[matched[3]:]:
+                if isinstance(offset, tuple):
+                    offset = (offset[0] + delta, offset[1])
+                run.errors.append(
+                    (line_number + delta, offset, text, check))
+            for old_point in previous.points:
+                if old_point[0] >= matched[0]:
+                    run.points.append((
+                        old_point[0] + delta, old_point[1], old_point[2],
+                        old_point[3] - matched[3] + point[3],
+                        old_point[4] - matched[4] + point[4]))
+            run.logical_lines += previous.logical_lines - matched[4]
+        return True
+
+    def check_all(self, expected=None, line_offset=0):
+        """Run all checks on the input file."""
+        report = self.report
+        self.total_lines = len(self.lines)
+        try:
+            # Record the results first, they are reported once complete
+            if not self.check_changes():
+                self.check_full()
+        finally:
+            self.report = report
+            self.report_error = report.error
+        run = self.previous = self._run
+        report.init_file(self.filename, self.lines, expected, line_offset)
+        for __ in range(run.logical_lines):
+            report.increment_logical_line()
+        for error in run.ast_errors + run.errors:
+            report.error(*error)
+        return report.get_file_results()
+
+
 class BaseReport(object):
     """Collect the results of the checks."""
 
@@ -1617,7 +1881,11 @@ class StyleGuide(object):
 
     def __init__(self, *args, **kwargs):
         # build options from the command line
-        self.checker_class = kwargs.pop('checker_class', Checker)
+        incremental = kwargs.pop('incremental', False)
+        self.checker_class = kwargs.pop(
+            'checker_class', IncrementalChecker if incremental else Checker)
+        # previous runs of the incremental checker, by file name
+        self.previous_runs = {} if incremental else None
         parse_argv = kwargs.pop('parse_argv', False)
         config_file = kwargs.pop('config_file', None)
         parser = kwargs.pop('parser', None)
@@ -1650,6 +1918,8 @@ class StyleGuide(object):
         options.physical_checks = self.get_checks('physical_line')
         options.logical_checks = self.get_checks('logical_line')
         options.ast_checks = self.get_checks('tree')
+        options.physical_dispatch = compile_checks(options.physical_checks)
+        options.logical_dispatch = compile_checks(options.logical_checks)
         self.init_report()
 
     def init_report(self, reporter=None):
@@ -1663,25 +1933,72 @@ class StyleGuide(object):
             paths = self.paths
         report = self.options.report
         runner = self.runner
+        parallel = self.options.jobs > 1 and hasattr(os, 'fork')
+        if parallel:
+            # Collect the files first, they are checked by a process pool
+            filenames = []
+            self.runner = filenames.append
         report.start()
         try:
             for path in paths:
                 if os.path.isdir(path):
                     self.input_dir(path)
                 elif not self.excluded(path):
-                    runner(path)
+                    self.runner(path)
+            if parallel:
+                self.runner = runner
+                self.input_files_parallel(filenames)
         except KeyboardInterrupt:
             print('... stopped')
+        finally:
+            self.runner = runner
         report.stop()
         return report
 
+    def input_files_parallel(self, filenames):
+        """Check files in a pool of processes, report them in order."""
+        global _parallel_style_guide
+        _parallel_style_guide = self
+        report = self.options.report
+        checks = {'readlines': readlines,
+                  'report_invalid_syntax': Checker.report_invalid_syntax}
+        for kind in ('physical_checks', 'logical_checks', 'ast_checks'):
+            for name, check, args in getattr(self.options, kind):
+                checks[name] = check
+        chunksize = max(1, len(filenames) // (self.options.jobs * 4))
+        pool = multiprocessing.get_context('fork').Pool(self.options.jobs)
+        try:
+            results = pool.imap(_check_file_in_worker, filenames, chunksize)
+            for filename, result in zip(filenames, results):
+                (lines, logical_lines, errors) = result
+                if self.options.verbose:
+                    print('checking %s' % filename)
+                report.init_file(filename, lines, None, 0)
+                for __ in range(logical_lines):
+                    report.increment_logical_line()
+                for line_number, offset, text, name in errors:
+                    report.error(line_number, offset, text, checks[name])
+                report.get_file_results()
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
     def input_file(self, filename, lines=None, expected=None, line_offset=0):
         """Run all checks on a Python source file."""
         if self.options.verbose:
             print('checking %s' % filename)
+        if self.previous_runs is None:
+            fchecker = self.checker_class(
+                filename, lines=lines, options=self.options)
+            return fchecker.check_all(expected=expected,
+                                      line_offset=line_offset)
         fchecker = self.checker_class(
-            filename, lines=lines, options=self.options)
-        return fchecker.check_all(expected=expected, line_offset=line_offset)
+            filename, lines=lines, options=self.options,
+            previous=self.previous_runs.get(filename))
+        result = fchecker.check_all(expected=expected, line_offset=line_offset)
+        self.previous_runs[filename] = fchecker.previous
+        return result
 
     def input_dir(self, dirname):
         """Check all files in this directory and all subdirectories."""
@@ -1699,6 +2016,7 @@ class StyleGuide(object):
             for subdir in sorted(dirs):
                 if self.excluded(subdir, root):
                     dirs.remove(subdir)
+            dirs.sort()
             for filename in sorted(files):
                 # contain a pattern that matches?
                 if ((filename_match(filename, filepatterns) and
@@ -1747,6 +2065,21 @@ class StyleGuide(object):
         return sorted(checks)
 
 
+_parallel_style_guide = None
+
+
+def _check_file_in_worker(filename):
+    """Check a file in a pool process, return picklable results."""
+    options = _parallel_style_guide.options
+    run = _CheckerRun(())
+    checker = _parallel_style_guide.checker_class(
+        filename, options=options, report=run)
+    checker.check_all()
+    errors = [(line_number, offset, text, check.__name__)
+              for line_number, offset, text, check in run.errors]
+    return run.lines, run.logical_lines, errors
+
+
 def get_parser(prog='pep8', version=__version__):
     parser = OptionParser(prog=prog, version=version,
                           usage="%prog [options] input ...")
@@ -1796,6 +2129,9 @@ def get_parser(prog='pep8', version=__version__):
     parser.add_option('--diff', action='store_true',
                       help="report only lines changed according to the "
                            "unified diff received on STDIN")
+    parser.add_option('-j', '--jobs', type='int', metavar='n', default=1,
+                      help="check files in n parallel processes "
+                           "(default: %default)")
     group = parser.add_option_group("Testing Options")
     if os.path.exists(TESTSUITE_PATH):
         group.add_option('--testsuite', metavar='dir',
@@ -4,8 +4,8 @@
 
 """
 Searches for all files supporting unit testing (-ut option) in the specified
-directory and runs them one by one. All tests must pass for gate script to
-exit normally.
+directory and runs them, in parallel with -j. All tests must pass for gate
+script to exit normally.
 """
 
 # Modules
@@ -19,6 +19,17 @@ import subprocess
 import getpass
 import shutil
 import time
+import threading
+import concurrent.futures
+import io
+import contextlib
+import json
+import hashlib
+import sqlite3
+import xml.sax.saxutils
+import xml.etree.ElementTree
+from uframe import user_cache_dir, BuildCache, PchCache
+from uframe import file_dependencies, run_child, Usage, DependencyGraph
 
 ###############################################################################
 # Gate Class
@@ -34,6 +45,13 @@ class Gate:
     # Configuration
     CFG_CPP_OPTS = "-std=c++11"
     CFG_EXTS = {"py": PYTHON, "cc": CPP, "": EXEC}
+    CFG_LANGUAGES = {PYTHON: "python", CPP: "cpp"}
+    CFG_CACHE_SIZE = 10000
+    CFG_SLOWEST = 10
+    CFG_HISTORY_RUNS = 10
+    CFG_SLOWDOWN = 2.
+    CFG_SLOWDOWN_MIN_TIME = .1
+    CFG_PRUNE_DIRS = [".git", ".hg", ".svn", "__pycache__", "build"]
 
     # OS setting
     IS_WIN = (os.name == "nt")
@@ -54,7 +72,189 @@ class Gate:
         parser.add_argument(
             "path", nargs="?", default=os.getcwd(),
             help="Optional path")
+        parser.add_argument(
+            "-j", dest="jobs", action="store", type=int, default=1,
+            help="Number of parallel jobs (default 1, 0 - number of CPUs)")
+        parser.add_argument(
+            "--no-cache", dest="no_cache", action="store_true",
+            help="Run all files ignoring the cached results")
+        parser.add_argument(
+            "--changed", action="store", nargs="?", const="HEAD",
+            metavar="REF",
+            help="Only run files changed against the git REF (default " +
+            "HEAD with staged and unstaged changes) and their importers")
+        parser.add_argument(
+            "--slowest", action="store", type=int, default=self.CFG_SLOWEST,
+            metavar="N",
+            help="Number of the slowest files to report (default " +
+            str(self.CFG_SLOWEST) + ")")
+        parser.add_argument(
+            "--report-json", dest="report_json", action="store",
+            metavar="FILE", help="Write a JSON report of the run")
+        parser.add_argument(
+            "--junit-xml", dest="junit_xml", action="store",
+            metavar="FILE", help="Write a JUnit XML report of the run")
         self.args = parser.parse_args(self.arg_str.split())
+        if self.args.jobs < 0:
+            parser.error("argument -j: expected 0 or a positive number")
+
+        # Result cache location
+        self.cache_file = os.path.join(user_cache_dir(), "gate_results.json")
+        self.index_file = os.path.join(user_cache_dir(), "gate_index.json")
+        self.history_file = os.path.join(
+            user_cache_dir(), "gate_history.sqlite")
+        self.build_cache = BuildCache(pch=PchCache())
+
+    def find_tests(self):
+        """ Return the list of (filename, language) supporting unit tests """
+
+        # NOTE: Binary files are not supported
+        exts = dict((ext, language)
+                    for ext, language in self.CFG_EXTS.items()
+                    if language != self.EXEC)
+        index = TestIndex(self.index_file)
+        tests = index.scan(self.args.path, exts, self.CFG_PRUNE_DIRS)
+        index.save()
+        return tests
+
+    def changed_files(self):
+        """ Return the set of files changed against the git REF or None """
+        top = git_command(self.args.path, "rev-parse", "--show-toplevel")
+        if top is None:
+            return None
+        top = top.strip()
+
+        # Committed, staged and unstaged changes plus the untracked files
+        diff = git_command(
+            top, "diff", "--name-only", "--no-renames", self.args.changed,
+            "--")
+        untracked = git_command(
+            top, "ls-files", "--others", "--exclude-standard")
+        if diff is None or untracked is None:
+            return None
+        return set(os.path.realpath(os.path.join(top, name))
+                   for name in (diff + untracked).splitlines() if name)
+
+    def changed_tests(self, tests, changed):
+        """ Select the tests which are changed or depend on changed files
+
+        Importers of deleted (or renamed) files can't be found by their
+        dependencies, so all the tests are selected if a file was deleted.
+        """
+        if any(not os.path.exists(path) for path in changed):
+            return list(tests)
+        selected = []
+        deps = {}
+        for filename, language in tests:
+            # Walk the local imports and includes of the test file
+            stack = [os.path.realpath(filename)]
+            seen = set(stack)
+            while stack:
+                path = stack.pop()
+                if path in changed:
+                    selected.append((filename, language))
+                    break
+                if path not in deps:
+                    deps[path] = [
+                        os.path.realpath(d) for d in file_dependencies(path)]
+                for dep in deps[path]:
+                    if dep not in seen:
+                        seen.add(dep)
+                        stack.append(dep)
+        return selected
+
+    def schedule(self, tests, averages):
+        """ Order the tests longest first to minimize the total run time
+
+        Files without history go first as they may be the longest ones.
+        """
+        def expected(test):
+            average = averages.get(os.path.abspath(test[0]))
+            return -average[0] if average else -float("inf")
+        return sorted(tests, key=expected)
+
+    def cache_key(self, filename, language, usage=None):
+        """ Result cache key, None if the file can't be cached
+
+        C++ files are keyed by the preprocessed source, the options and the
+        compiler version, which is the build cache key as well. Python files
+        are keyed by the contents of the file and of all its local imports
+        (transitively) and the Python version.
+        """
+        if language == self.CPP:
+            return self.build_cache.key(
+                filename, self.CFG_CPP_OPTS.split(), usage)
+        return files_digest(DependencyGraph(filename).files, sys.version)
+
+    def run_test(self, filename, language, key=None):
+        """ Run unit tests of a single file, return (status, output, phases)
+
+        Phases is the list of (name, Usage) of the compile and run phases.
+        The cache key of a C++ file saves preprocessing it again.
+        """
+
+        if language == self.PYTHON:
+
+            # Run Python files
+            exe = ["python"] if self.IS_WIN else []
+            status, output, usage = run_command(exe + [filename, "-ut"])
+            return status, output, [("run", usage)]
+
+        elif language == self.CPP:
+
+            # Run C++ files straight from the build cache
+            compile_start = time.time()
+            compile_usage = Usage()
+            status, output, bin = self.build_cache.build(
+                filename, self.CFG_CPP_OPTS.split(), usage=compile_usage,
+                key=key)
+            compile_usage.wall = time.time() - compile_start
+            phases = [("compile", compile_usage)]
+            if not status:
+                status, run_output, usage = run_command([bin, "-ut"])
+                output += run_output
+                phases.append(("run", usage))
+            return status, output, phases
+
+    def make_record(self, filename, language, status, output, phases):
+        """ Return the report record of a file """
+        times = dict((name, usage.wall) for name, usage in phases)
+        if output is None:
+            result = "cached" if status == 0 else "not run"
+        else:
+            result = "failed" if status else "passed"
+        record = {"file": filename,
+                  "language": self.CFG_LANGUAGES[language],
+                  "result": result, "status": status,
+                  "compile_time": times.get("compile"),
+                  "run_time": times.get("run")}
+        record.update(parse_test_counts(output or ""))
+        if result == "failed" and not (
+                record["failures"] or record["errors"]):
+            # A crash or a failure outside the tests is still a failure
+            record["tests"] = record["tests"] or 1
+            record["failures"] = 1
+        record["output"] = output
+        return record
+
+    def print_slowest(self, records):
+        """ Print the slowest files with the usage of each phase """
+        records = sorted(
+            records, key=lambda r: -sum(u.wall for name, u in r[1]))
+        count = min(self.args.slowest, len(records))
+        if not count:
+            return
+        print("\nGATE: Slowest " + str(count) + " of " + str(len(records)) +
+              " files")
+        print("GATE: " + "".join(t.rjust(9) for t in (
+              "wall", "user", "sys", "max RSS")) + "  phase    file")
+        for filename, phases in records[:count]:
+            for name, usage in phases:
+                times = [usage.wall, usage.utime, usage.stime]
+                print("GATE: " + "".join(
+                      (str(round(t, 3)) + "s").rjust(9) for t in times) +
+                      (str(round(usage.maxrss / 1024., 1)) + "MB").rjust(9) +
+                      "  " + name.ljust(9) + filename)
 
     def run(self, test=False):
         """ Main execution function """
@@ -66,51 +266,126 @@ class Gate:
         start_time = time.time()
 
         fail = 0
+        # Serial time estimated from the history averages of the run files
+        serial_time = 0
+        ran = 0
+        records = []
+        reports = []
+        if self.args.report_json:
+            reports.append(JsonReport(self.args.report_json))
+        if self.args.junit_xml:
+            reports.append(JunitReport(self.args.junit_xml))
+        totals = dict((key, 0) for key in TOTALS_KEYS)
+        history = TimingHistory(self.history_file, self.CFG_HISTORY_RUNS)
+        averages = history.averages()
+        slower = []
+        jobs = self.args.jobs or os.cpu_count() or 1
+        lock = threading.Lock()
+        cache = None if self.args.no_cache else ResultCache(
+            self.cache_file, self.CFG_CACHE_SIZE)
 
-        for ext in reversed(sorted(self.CFG_EXTS.keys())):
-            language = self.CFG_EXTS[ext]
+        def timed_test(filename, language):
+            # Tests still waiting for a worker are skipped after a failure
+            with lock:
+                if fail:
+                    return None
+            test_start = time.time()
+            key_usage = Usage()
+            key = cache and self.cache_key(filename, language, key_usage)
+            if key and lookup and cache.lookup(key):
+                return 0, None, time.time() - test_start, []
+            status, output, phases = self.run_test(filename, language, key)
+            # Preprocessing for the key is a part of the compilation
+            if phases and phases[0][0] == "compile":
+                phases[0][1].add(key_usage)
+            if key and not status:
+                cache.store(key)
+            return status, output, time.time() - test_start, phases
 
-            # NOTE: Binary files are not supported
-            if language == self.EXEC:
-                continue
+        tests = self.find_tests()
+        lookup = True
+        if self.args.changed:
+            changed = self.changed_files()
+            if changed is None:
+                print("GATE: Can't get git changes, running all files")
+            else:
+                total = len(tests)
+                tests = self.changed_tests(tests, changed)
+                # Selected files are run, their passes are still cached
+                lookup = False
+                print("GATE: " + str(len(tests)) + " of " + str(total) +
+                      " files affected by changes against " +
+                      self.args.changed)
 
-            # Search files
-            pats = ["\." + ext + "$"]
-            files = find_files(self.args.path, patterns=pats)
+        with concurrent.futures.ThreadPoolExecutor(jobs) as pool:
+            futures = {}
+            for filename, language in self.schedule(tests, averages):
+                future = pool.submit(timed_test, filename, language)
+                futures[future] = (filename, language)
 
-            for filename in files:
+            # Print each file output as a single block once it's finished
+            for future in concurrent.futures.as_completed(futures):
+                filename, language = futures[future]
+                result = future.result() or (None, None, 0, [])
+                status, output, file_time, phases = result
 
-                if fail:
-                    break
-
-                # Check that file supports unit tests
-                if not search_file("\-ut", filename):
+                # Stream the reports, outputs are not kept after that
+                if reports:
+                    record = self.make_record(
+                        filename, language, status, output, phases)
+                    add_totals(totals, record)
+                    for report in reports:
+                        report.add(record)
+                if result[0] is None:
                     continue
+                if phases:
+                    records.append((filename, phases))
+                if output is None:
+                    print("\nGATE: cached PASS " + filename)
+                    continue
+                abs_name = os.path.abspath(filename)
+                average = averages.get(abs_name)
+                ran += 1
+                if average and serial_time is not None:
+                    serial_time += average[0]
+                else:
+                    serial_time = None
 
+                # Durations of passed runs are compared to the history
+                if not status:
+                    if (average and average[1] >= 3 and
+                            file_time > average[0] * self.CFG_SLOWDOWN and
+                            file_time > self.CFG_SLOWDOWN_MIN_TIME):
+                        slower.append((filename, file_time) + average)
+                    history.record(abs_name, file_time)
                 print("\nGATE: Running Unit Tests for " + filename)
-
-                if language == self.PYTHON:
-
-                    # Run Python files
-                    EXE = "python " if os.name == "nt" else ""
-                    if os.system(EXE + filename + " -ut"):
+                sys.stdout.write(output)
+                print("GATE: " + ("FAILED " if status else "Finished ") +
+                      filename + " in " + str(round(file_time, 3)) + "s")
+                sys.stdout.flush()
+                if status:
+                    with lock:
                         fail = 1
 
-                elif language == self.CPP:
-
-                    # Run C++ files
-                    bin = "/tmp/" + filename_strip_ext(filename)
-                    options = self.CFG_CPP_OPTS
-                    build = "g++ " + options + " -o " + bin + " " + filename
-
-                    if os.system(build):
-                        fail = 1
-                    else:
-                        if os.system(bin + " -ut"):
-                            fail = 1
+        if cache:
+            cache.save()
+        history.close()
 
         elp_time = time.time() - start_time
+        totals["elapsed"] = elp_time
+        for report in reports:
+            report.close(totals)
         print("\nGATE: Elapsed Time " + str(round(elp_time, 3)) + "s")
+        if jobs > 1 and ran and serial_time and elp_time > 0:
+            print("GATE: Speedup " + str(round(serial_time / elp_time, 2)) +
+                  "x over serial time " + str(round(serial_time, 3)) +
+                  "s estimated from history (jobs " + str(jobs) + ")")
+        self.print_slowest(records)
+        for filename, file_time, average, runs in slower:
+            print("GATE: " + self.XC_RED + "SLOWER" + self.XC_ENDC + " " +
+                  filename + " " + str(round(file_time, 3)) + "s vs " +
+                  str(round(average, 3)) + "s average of " + str(runs) +
+                  " runs")
 
         if fail:
             print("GATE: " + self.XC_RED + "FAILED!" + self.XC_ENDC)
@@ -119,45 +394,358 @@ class Gate:
             print("GATE: " + self.XC_GRN + "ALL TESTS PASSED!" + self.XC_ENDC)
 
 
+###############################################################################
+# ResultCache Class
+###############################################################################
+
+
+class ResultCache:
+    """ Persistent set of passed test keys with LRU eviction """
+
+    def __init__(self, filename, size):
+        """ Default constructor """
+        self.filename = filename
+        self.size = size
+        self.lock = threading.Lock()
+        # Maps a key to its last use time
+        self.entries = {}
+        try:
+            with open(self.filename) as fh:
+                self.entries = dict(json.load(fh))
+        except (OSError, ValueError, TypeError):
+            pass
+
+    def lookup(self, key):
+        """ Return True if the key has passed before """
+        with self.lock:
+            if key not in self.entries:
+                return False
+            self.entries[key] = time.time()
+            return True
+
+    def store(self, key):
+        """ Record a passed key """
+        with self.lock:
+            self.entries[key] = time.time()
+
+    def save(self):
+        """ Evict the least recently used keys and write the cache """
+        with self.lock:
+            if len(self.entries) > self.size:
+                keep = sorted(self.entries, key=self.entries.get)
+                for key in keep[:len(self.entries) - self.size]:
+                    del self.entries[key]
+            tmp_file = self.filename + "." + str(os.getpid())
+            with open(tmp_file, "w") as fh:
+                json.dump(self.entries, fh)
+            os.replace(tmp_file, self.filename)
+
+###############################################################################
+# Report Classes
+###############################################################################
+
+
+TOTALS_KEYS = ["files", "passed", "failed", "cached", "not run", "tests",
+               "failures", "errors", "skipped", "compile_time", "run_time"]
+
+
+def add_totals(totals, record):
+    """ Add a file record to the report totals """
+    totals["files"] += 1
+    totals[record["result"]] += 1
+    for key in TOTALS_KEYS[5:]:
+        totals[key] += record.get(key) or 0
+
+
+class JsonReport:
+    """ JSON report written one file record at a time """
+
+    def __init__(self, filename):
+        """ Default constructor """
+        self.fh = open(filename, "w")
+        self.fh.write("{\"files\": [")
+        self.count = 0
+
+    def add(self, record):
+        """ Write a file record """
+        self.fh.write(("," if self.count else "") + "\n" + json.dumps(record))
+        self.count += 1
+
+    def close(self, totals):
+        """ Write the totals and close the report """
+        self.fh.write("\n], \"totals\": " + json.dumps(totals) + "}\n")
+        self.fh.close()
+
+
+class JunitReport:
+    """ JUnit XML report written one test suite (file) at a time
+
+    The totals are only known at the end, so the root element reserves space
+    for its attributes which is overwritten when the report is closed.
+    """
+
+    RESERVED = 160
+    # Characters not allowed in XML 1.0 (terminal escapes included)
+    INVALID_RE = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+    def __init__(self, filename):
+        """ Default constructor """
+        self.fh = open(filename, "wb")
+        self.write("<?xml version=\"1.0\" encoding=\"UTF-8\"?>\n")
+        self.write("<testsuites name=\"gate\"")
+        self.reserved_pos = self.fh.tell()
+        self.write(" " * self.RESERVED + ">\n")
+
+    def write(self, text):
+        """ Write XML text """
+        self.fh.write(text.encode("utf-8", errors="replace"))
+
+    def attrs(self, **kwargs):
+        """ Return XML attributes """
+        return "".join(
+            " " + name + "=" + xml.sax.saxutils.quoteattr(
+                self.INVALID_RE.sub("", str(value)))
+            for name, value in sorted(kwargs.items()) if value is not None)
+
+    def add(self, record):
+        """ Write a test suite with a test case for each phase """
+        total_time = (
+            (record["compile_time"] or 0) + (record["run_time"] or 0))
+        self.write("<testsuite" + self.attrs(
+            name=record["file"], tests=record["tests"] or 0,
+            failures=record["failures"] or 0, errors=record["errors"] or 0,
+            skipped=record["skipped"] or 0, time=round(total_time, 6)) +
+            ">\n")
+        self.write("<properties>")
+        for name in ("language", "result", "status"):
+            self.write("<property" + self.attrs(
+                name=name, value=record[name]) + "/>")
+        self.write("</properties>\n")
+        for phase in ("compile", "run"):
+            phase_time = record[phase + "_time"]
+            if phase_time is None:
+                continue
+            self.write("<testcase" + self.attrs(
+                classname=record["file"], name=phase,
+                time=round(phase_time, 6)))
+            if record["result"] == "failed" and (
+                    phase == "run" or record["run_time"] is None):
+                self.write("><failure" + self.attrs(
+                    message="exit status " + str(record["status"])) +
+                    "/></testcase>\n")
+            else:
+                self.write("/>\n")
+        if record["result"] in ("cached", "not run"):
+            self.write("<testcase" + self.attrs(
+                classname=record["file"], name=record["result"], time=0) +
+                "><skipped/></testcase>\n")
+        if record["output"]:
+            self.write("<system-out>" + xml.sax.saxutils.escape(
+                self.INVALID_RE.sub("", record["output"])) +
+                "</system-out>\n")
+        self.write("</testsuite>\n")
+
+    def close(self, totals):
+        """ Write the totals into the root element and close the report """
+        self.write("</testsuites>\n")
+        self.fh.seek(self.reserved_pos)
+        self.write(self.attrs(
+            tests=totals["tests"], failures=totals["failures"],
+            errors=totals["errors"], skipped=totals["skipped"],
+            time=round(totals["elapsed"], 6)).ljust(self.RESERVED)[
+            :self.RESERVED])
+        self.fh.close()
+
+###############################################################################
+# TimingHistory Class
+###############################################################################
+
+
+class TimingHistory:
+    """ Durations of the last passed runs of each file kept in SQLite """
+
+    def __init__(self, filename, runs=10):
+        """ Default constructor """
+        self.runs = runs
+        self.db = sqlite3.connect(filename, timeout=10)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS durations (" +
+            "file TEXT NOT NULL, duration REAL NOT NULL, time REAL NOT NULL)")
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS durations_file ON durations (file)")
+
+    def averages(self):
+        """ Return {file: (moving average duration, number of runs)} """
+        rows = self.db.execute(
+            "SELECT file, AVG(duration), COUNT(*) FROM durations " +
+            "GROUP BY file")
+        return dict((name, (average, count)) for name, average, count in rows)
+
+    def record(self, filename, duration):
+        """ Add a duration of the file, keep only the last runs """
+        self.db.execute(
+            "INSERT INTO durations VALUES (?, ?, ?)",
+            (filename, duration, time.time()))
+        self.db.execute(
+            "DELETE FROM durations WHERE file = ? AND rowid NOT IN (" +
+            "SELECT rowid FROM durations WHERE file = ? " +
+            "ORDER BY rowid DESC LIMIT ?)", (filename, filename, self.runs))
+        # Don't lock the database for other gate runs (tests run the gate)
+        self.db.commit()
+
+    def close(self):
+        """ Close the database """
+        self.db.close()
+
+###############################################################################
+# TestIndex Class
+###############################################################################
+
+
+class TestIndex:
+    """ Persistent index of files supporting unit tests """
+
+    def __init__(self, filename):
+        """ Default constructor """
+        self.filename = filename
+        self.modified = False
+        # Maps an absolute file name to [mtime_ns, size, supports -ut]
+        self.entries = {}
+        try:
+            with open(self.filename) as fh:
+                self.entries = dict(json.load(fh))
+        except (OSError, ValueError, TypeError):
+            pass
+
+    def scan(self, path, exts, prune=()):
+        """ Return (filename, language) of the -ut files found in the path """
+        tests = []
+        root = os.path.abspath(path).rstrip(os.sep)
+        seen = set()
+        stack = [(path, root)]
+        while stack:
+            dir, abs_dir = stack.pop()
+            try:
+                entries = os.scandir(dir)
+            except OSError:
+                continue
+            with entries:
+                for entry in entries:
+                    name = entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        if name not in prune:
+                            stack.append((entry.path, abs_dir + os.sep + name))
+                        continue
+                    language = exts.get(name.rpartition(".")[2])
+                    if language is None or "." not in name:
+                        continue
+                    abs_name = abs_dir + os.sep + name
+                    seen.add(abs_name)
+                    if self.supports_ut(entry, abs_name):
+                        tests.append((entry.path, language))
+        tests.sort()
+
+        # Forget the files removed from the scanned path
+        prefix = root + os.sep
+        for name in list(self.entries):
+            if name.startswith(prefix) and name not in seen:
+                del self.entries[name]
+                self.modified = True
+        return tests
+
+    def supports_ut(self, entry, abs_name):
+        """ Check for -ut in the file unless it's unchanged since the scan """
+        try:
+            st = entry.stat()
+        except OSError:
+            return False
+        cached = self.entries.get(abs_name)
+        if cached and cached[:2] == [st.st_mtime_ns, st.st_size]:
+            return cached[2]
+        try:
+            with open(entry.path, "rb") as fh:
+                found = b"-ut" in fh.read()
+        except OSError:
+            found = False
+        self.entries[abs_name] = [st.st_mtime_ns, st.st_size, found]
+        self.modified = True
+        return found
+
+    def save(self):
+        """ Write the index if it was modified """
+        if not self.modified:
+            return
+        tmp_file = self.filename + "." + str(os.getpid())
+        with open(tmp_file, "w") as fh:
+            json.dump(self.entries, fh)
+        os.replace(tmp_file, self.filename)
+        self.modified = False
+
 ###############################################################################
 # Helping functions
 ###############################################################################
 
 
-def search_file(pattern, filename):
-    """ Search file and return only the first match """
-    if not os.path.exists(filename):
-        raise Exception("Can't open file for reading! " + filename)
+def run_command(args):
+    """ Run a command, return the status, merged stdout/stderr and Usage """
+    try:
+        status, stdout, usage = run_child(args, stderr=subprocess.STDOUT)
+    except OSError as e:
+        return 1, "Can't run " + args[0] + ": " + str(e) + "\n", Usage()
+    return status, stdout.decode(errors="replace"), usage
+
 
-    fh = open(filename, "r")
-    for line in fh:
-        allmatch = re.findall(pattern, line)
-        if allmatch:
-            fh.close()
-            return allmatch[0]
+def parse_test_counts(output):
+    """ Parse unittest and cppunit summaries into the test counts
 
-    fh.close()
-    return None
+    Counts are None if the output has no summary. Summaries of several test
+    runs in the same output are added up.
+    """
+    counts = dict((key, None) for key in (
+        "tests", "failures", "errors", "skipped"))
+    for m in re.finditer("^Ran (\d+) (?:test|check)s? in ", output, re.M):
+        counts["tests"] = (counts["tests"] or 0) + int(m.group(1))
+    if counts["tests"] is None:
+        return counts
+    for key in ("failures", "errors", "skipped"):
+        counts[key] = 0
+    for m in re.finditer("^(?:OK|FAILED) \(([^)]*)\)", output, re.M):
+        for item in m.group(1).split(","):
+            key, sep, value = item.strip().partition("=")
+            if key in counts and value.isdigit():
+                counts[key] += int(value)
+    return counts
 
 
-def filename_strip_ext(filename):
-    """ Return file name w/o extension and dirs """
-    base = os.path.basename(filename)
-    # Strip file extension
-    return os.path.splitext(base)[0]
+def git_command(path, *args):
+    """ Run a git command in the path, return its output or None """
+    try:
+        proc = subprocess.run(
+            ["git", "-C", path] + list(args),
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except OSError:
+        return None
+    if proc.returncode:
+        return None
+    return proc.stdout.decode(errors="replace")
 
 
-def find_files(dir, patterns=[]):
-    result = []
-    for path, dirs, files in os.walk(dir):
-        for file in files:
-            skip = 1 if patterns else 0
-            for pattern in patterns:
-                if re.search(pattern, file):
-                    skip = 0
-            if not skip:
-                result.append(path + "/" + file)
-    return result
+def files_digest(filenames, *extras):
+    """ Return a hash of the file names and contents and extra strings """
+    digest = hashlib.sha256()
+    for filename in filenames:
+        digest.update(filename.encode() + b"\0")
+        try:
+            with open(filename, "rb") as fh:
+                digest.update(fh.read())
+        except OSError:
+            # Missing files are part of the key as well
+            digest.update(b"\0missing")
+        digest.update(b"\0")
+    for extra in extras:
+        digest.update(b"\0" + extra.encode())
+    return digest.hexdigest()
+
 
 ###############################################################################
 # Unit Tests
@@ -172,6 +760,14 @@ class unitTests(unittest.TestCase):
 
     def setUp(self):
         os.makedirs(self.test_area, exist_ok=True)
+        # Caches and indexes of the tested objects stay in the test area
+        self.environ = dict(os.environ)
+        os.environ["XDG_CACHE_HOME"] = self.test_area + "/cache"
+        os.environ["LOCALAPPDATA"] = self.test_area + "/cache"
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
 
     def test_Gate_class__basic_functionality(self):
         """ Gate class basic testing """
@@ -180,13 +776,292 @@ class unitTests(unittest.TestCase):
         d = Gate()
         self.assertEqual(d.args.path, os.getcwd())
 
+        # Negative number of jobs is an argument error
+        with contextlib.redirect_stderr(io.StringIO()):
+            self.assertRaises(SystemExit, Gate, "-j -1")
+
     def test_Gate_class__run(self):
         """ Main execution function """
         d = Gate()
         d.run(test=True)
 
+    def test_Gate_class__parallel_run(self):
+        """ Parallel execution of the unit tests """
+        gate_dir = self.test_area + "/gate"
+        os.makedirs(gate_dir, exist_ok=True)
+        for name, code in (("pass", 0), ("fail", 1)):
+            filename = gate_dir + "/" + name + ".py"
+            with open(filename, "w") as fh:
+                fh.write("#!/usr/bin/env python3\nimport sys\n" +
+                         "print('-ut " + name + "')\n" +
+                         "sys.exit(" + str(code) + ")\n")
+            os.chmod(filename, 0o755)
+
+        report = self.test_area + "/report"
+        d = Gate(gate_dir + " -j 2 --no-cache --report-json " + report +
+                 ".json --junit-xml " + report + ".xml")
+        d.history_file = self.test_area + "/history.sqlite"
+        self.assertEqual(d.args.jobs, 2)
+        history = TimingHistory(d.history_file)
+        for name, duration in (("pass", 2.), ("fail", 1.)):
+            history.record(gate_dir + "/" + name + ".py", duration)
+        history.close()
+        tests = sorted(d.find_tests())
+        self.assertEqual(tests, [
+            (gate_dir + "/fail.py", d.PYTHON),
+            (gate_dir + "/pass.py", d.PYTHON)])
+        self.assertEqual(d.run_test(*tests[0])[:2], (1, "-ut fail\n"))
+        status, output, phases = d.run_test(*tests[1])
+        self.assertEqual((status, output), (0, "-ut pass\n"))
+        self.assertEqual([name for name, usage in phases], ["run"])
+        self.assertGreater(phases[0][1].wall, 0)
+
+        # Failing gate prints each output as a single block
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            self.assertRaises(SystemExit, d.run)
+        self.assertIn("fail.py\n-ut fail\nGATE: FAILED ", out.getvalue())
+        self.assertIn("x over serial time 3.0s estimated from history " +
+                      "(jobs 2)\n", out.getvalue())
+        self.assertIn("GATE: Slowest 2 of 2 files", out.getvalue())
+
+        # Reports have a record for each file and the totals
+        with open(report + ".json") as fh:
+            data = json.load(fh)
+        self.assertEqual(
+            sorted((r["file"], r["result"]) for r in data["files"]),
+            [(tests[0][0], "failed"), (tests[1][0], "passed")])
+        self.assertEqual(data["totals"]["files"], 2)
+        self.assertEqual(data["totals"]["failed"], 1)
+        root = xml.etree.ElementTree.parse(report + ".xml").getroot()
+        self.assertEqual(root.tag, "testsuites")
+        self.assertEqual(root.get("failures"), "1")
+        self.assertEqual([s.get("failures") for s in sorted(
+            root.findall("testsuite"), key=lambda s: s.get("name"))],
+            ["1", "0"])
+        self.assertEqual(len(root.findall("testsuite")), 2)
+        self.assertEqual(len(root.findall("testsuite/testcase/failure")), 1)
+
+    def test_TimingHistory_class(self):
+        """ Moving averages, longest first order and slowdowns """
+        history_dir = self.test_area + "/history"
+        os.makedirs(history_dir, exist_ok=True)
+        history_file = history_dir + "/history.sqlite"
+        history = TimingHistory(history_file, runs=3)
+        for duration in (9., 1., 2., 3.):
+            history.record("a", duration)
+        history.record("b", 5.)
+        history.close()
+        history = TimingHistory(history_file, runs=3)
+        self.assertEqual(history.averages(), {"a": (2., 3), "b": (5., 1)})
+        history.close()
+
+        # Files without history first, then the longest ones
+        d = Gate(history_dir + " --no-cache")
+        d.history_file = history_file
+        tests = [(name, d.PYTHON) for name in ("x", "a", "c", "b")]
+        averages = {os.path.abspath("a"): (2., 3),
+                    os.path.abspath("b"): (5., 1)}
+        self.assertEqual([name for name, language in d.schedule(
+            tests, averages)], ["x", "c", "b", "a"])
+
+        # Files much slower than their average are flagged
+        filename = history_dir + "/slow.py"
+        with open(filename, "w") as fh:
+            fh.write("#!/usr/bin/env python3\nimport time\n" +
+                     "time.sleep(.2)\nprint('-ut')\n")
+        os.chmod(filename, 0o755)
+        history = TimingHistory(history_file)
+        for i in range(3):
+            history.record(os.path.abspath(filename), .01)
+        history.close()
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            d.run()
+        self.assertIn("SLOWER" + d.XC_ENDC + " " + filename, out.getvalue())
+        history = TimingHistory(history_file)
+        self.assertEqual(history.averages()[os.path.abspath(filename)][1], 4)
+        history.close()
+
+    def test_parse_test_counts(self):
+        """ Test counts of unittest and cppunit summaries """
+        self.assertEqual(parse_test_counts("no summary\n"), {
+            "tests": None, "failures": None, "errors": None,
+            "skipped": None})
+        self.assertEqual(parse_test_counts(
+            "Ran 3 tests in 0.1s\n\nFAILED (failures=1, errors=2, " +
+            "skipped=1)\nRan 4 checks in 0s\n\nFAILED (failures=2)"), {
+            "tests": 7, "failures": 3, "errors": 2, "skipped": 1})
+        self.assertEqual(parse_test_counts("Ran 1 test in 0s\n\nOK\n"), {
+            "tests": 1, "failures": 0, "errors": 0, "skipped": 0})
+
+    def test_ResultCache_class(self):
+        """ Result cache lookups, eviction and persistence """
+        cache_file = self.test_area + "/cache.json"
+        cache = ResultCache(cache_file, 2)
+        self.assertFalse(cache.lookup("a"))
+        cache.store("a")
+        self.assertTrue(cache.lookup("a"))
+        cache.store("b")
+        cache.store("c")
+        cache.save()
+        cache = ResultCache(cache_file, 2)
+        self.assertEqual(sorted(cache.entries), ["b", "c"])
+
+        # Passed files are reported from the cache on the next run
+        cache_dir = self.test_area + "/cache"
+        os.makedirs(cache_dir, exist_ok=True)
+        filename = cache_dir + "/cached.py"
+        with open(filename, "w") as fh:
+            fh.write("#!/usr/bin/env python3\nprint('-ut')\n")
+        os.chmod(filename, 0o755)
+        d = Gate(cache_dir)
+        d.cache_file = cache_dir + "/results.json"
+        d.history_file = cache_dir + "/history.sqlite"
+        key = d.cache_key(filename, d.PYTHON)
+        for cached in (False, True):
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                d.run()
+            self.assertEqual(
+                "GATE: cached PASS " + filename in out.getvalue(), cached)
+            # Serial runs have no speedup to report
+            self.assertNotIn("GATE: Speedup", out.getvalue())
+        self.assertTrue(ResultCache(d.cache_file, 1).lookup(key))
+        with open(filename, "a") as fh:
+            fh.write("\n")
+        self.assertNotEqual(d.cache_key(filename, d.PYTHON), key)
+
+        # Changes of the imported modules run the file again
+        helper = cache_dir + "/helper.py"
+        with open(helper, "w") as fh:
+            fh.write("import sys\n")
+        with open(filename, "w") as fh:
+            fh.write("#!/usr/bin/env python3\nimport helper\nprint('-ut')\n")
+        for text, cached in (("", False), ("", True), ("sys.exit(1)\n", None)):
+            with open(helper, "a") as fh:
+                fh.write(text)
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                if cached is None:
+                    self.assertRaises(SystemExit, d.run)
+                else:
+                    d.run()
+            self.assertEqual("GATE: cached PASS " + filename in
+                             out.getvalue(), bool(cached))
+
+        # C++ files are keyed by the preprocessed source
+        source = cache_dir + "/cached.cc"
+        header = cache_dir + "/cached.h"
+        with open(header, "w") as fh:
+            fh.write("int x = 1;\n")
+        with open(source, "w") as fh:
+            fh.write("#include \"cached.h\"\nint main() { return x; }\n")
+        key = d.cache_key(source, d.CPP)
+        with open(header, "w") as fh:
+            fh.write("int x = 2;\n")
+        self.assertNotEqual(d.cache_key(source, d.CPP), key)
+
+    def test_Gate_class__changed(self):
+        """ Only changed files and their importers are run """
+        repo = self.test_area + "/repo"
+        os.makedirs(repo, exist_ok=True)
+        files = {"a.py": "import helper\nprint('-ut')\n",
+                 "b.py": "print('-ut')\n", "helper.py": "x = 1\n"}
+        for name, text in files.items():
+            with open(repo + "/" + name, "w") as fh:
+                fh.write(text)
+        git = ["-c", "user.name=ut", "-c", "user.email=ut@ut"]
+        if git_command(repo, "init", "-q") is None:
+            # git is not available
+            return
+        git_command(repo, "add", ".")
+        git_command(repo, *(git + ["commit", "-q", "-m", "ut"]))
+
+        d = Gate(repo + " --changed")
+        self.assertEqual(d.args.changed, "HEAD")
+        tests = d.find_tests()
+        self.assertEqual(d.changed_files(), set())
+        self.assertEqual(d.changed_tests(tests, set()), [])
+
+        # Unstaged change of an imported file and an untracked test
+        with open(repo + "/helper.py", "a") as fh:
+            fh.write("y = 2\n")
+        with open(repo + "/c.py", "w") as fh:
+            fh.write("print('-ut')\n")
+        changed = d.changed_files()
+        self.assertEqual(changed, set(os.path.realpath(repo + "/" + name)
+                                      for name in ("helper.py", "c.py")))
+        self.assertEqual(sorted(d.changed_tests(d.find_tests(), changed)), [
+            (repo + "/a.py", d.PYTHON), (repo + "/c.py", d.PYTHON)])
+
+        # Committed changes against an older REF
+        git_command(repo, "add", ".")
+        git_command(repo, *(git + ["commit", "-q", "-m", "ut2"]))
+        self.assertEqual(d.changed_files(), set())
+        d = Gate(repo + " --changed HEAD~1")
+        self.assertEqual(d.changed_files(), changed)
+        self.assertIsNone(Gate(repo + " --changed nosuchref").changed_files())
+
+        # Deleted files select everything, selected files are not cached
+        git_command(repo, "rm", "-q", "helper.py")
+        d = Gate(repo + " --changed")
+        d.history_file = self.test_area + "/history.sqlite"
+        changed = d.changed_files()
+        self.assertEqual(changed, set([os.path.realpath(repo + "/helper.py")]))
+        tests = d.find_tests()
+        self.assertEqual(d.changed_tests(tests, changed), tests)
+        cache = ResultCache(d.cache_file, d.CFG_CACHE_SIZE)
+        for filename, language in tests:
+            cache.store(d.cache_key(filename, language))
+        cache.save()
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            self.assertRaises(SystemExit, d.run)
+        self.assertIn("GATE: 3 of 3 files affected", out.getvalue())
+        self.assertNotIn("cached PASS", out.getvalue())
+
+    def test_TestIndex_class(self):
+        """ Discovery index pruning, invalidation and persistence """
+        index_dir = self.test_area + "/index"
+        for subdir in ("src", "__pycache__", ".git"):
+            os.makedirs(index_dir + "/" + subdir, exist_ok=True)
+        files = {"src/a.py": "-ut\n", "src/b.cc": "-ut\n", "c.py": "\n",
+                 "d.txt": "-ut\n", "__pycache__/e.py": "-ut\n",
+                 ".git/f.py": "-ut\n"}
+        for name, text in files.items():
+            with open(index_dir + "/" + name, "w") as fh:
+                fh.write(text)
+        exts = {"py": Gate.PYTHON, "cc": Gate.CPP}
+        index_file = self.test_area + "/index.json"
+        index = TestIndex(index_file)
+        tests = [(index_dir + "/src/a.py", Gate.PYTHON),
+                 (index_dir + "/src/b.cc", Gate.CPP)]
+        self.assertEqual(index.scan(index_dir, exts, Gate.CFG_PRUNE_DIRS),
+                         tests)
+        self.assertEqual(len(index.entries), 3)
+        index.save()
+
+        # Unchanged files are taken from the saved index
+        index = TestIndex(index_file)
+        index.entries[os.path.abspath(index_dir + "/c.py")][2] = True
+        self.assertEqual(
+            len(index.scan(index_dir, exts, Gate.CFG_PRUNE_DIRS)), 3)
+        self.assertFalse(index.modified)
+        self.assertEqual(len(index.scan(index_dir, exts)), 5)
+        self.assertTrue(index.modified)
+
+        # Modified and removed files are rescanned or forgotten
+        with open(index_dir + "/c.py", "w") as fh:
+            fh.write("-ut\n")
+        os.remove(index_dir + "/src/b.cc")
+        index = TestIndex(index_file)
+        self.assertEqual(index.scan(index_dir, exts, Gate.CFG_PRUNE_DIRS), [
+            (index_dir + "/c.py", Gate.PYTHON), tests[0]])
+        self.assertEqual(len(index.entries), 2)
+
     def test_xcleanup(self):
-        shutil.rmtree(self.tmp_area)
+        shutil.rmtree(self.test_area)
 
 if __name__ == "__main__":
     if sys.argv[-1] == "-ut":
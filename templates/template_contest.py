@@ -4,6 +4,107 @@
 import unittest
 import sys
 
+###############################################################################
+# Reader and Writer Classes (Fast input/output)
+###############################################################################
+
+
+class Reader:
+    """ Input read at once from stdin (or a test string), tokens are split
+    chunk by chunk and read in order by the reading methods """
+
+    CHUNK = 1 << 16
+
+    def __init__(self, data=None):
+        """ Default constructor """
+        import re
+        if data is None:
+            data = sys.stdin.buffer.read()
+        elif isinstance(data, str):
+            data = data.encode()
+        self.data = data
+        self.space_re = re.compile(b"\\s")
+        self.offset = 0
+        self.words = []
+        self.pos = 0
+
+    def fill(self):
+        """ Split the next chunk of the input into tokens, False at the end """
+        if self.offset >= len(self.data):
+            return False
+        m = self.space_re.search(self.data, self.offset + self.CHUNK)
+        end = m.end() if m else len(self.data)
+        self.words = self.data[self.offset:end].split()
+        self.offset = end
+        self.pos = 0
+        return True
+
+    def chunks(self, count=None):
+        """ Generate the lists of the next count tokens (all by default) """
+        while count is None or count > 0:
+            if self.pos >= len(self.words) and not self.fill():
+                return
+            end = len(self.words)
+            if count is not None:
+                end = min(end, self.pos + count)
+                count -= end - self.pos
+            words = self.words[self.pos:end]
+            self.pos = end
+            yield words
+
+    def tokens(self, count=None):
+        """ Next count tokens (all remaining by default) """
+        return [word.decode() for words in self.chunks(count)
+                for word in words]
+
+    def ints(self, count=None, typecode=None):
+        """ Next count integers (all remaining by default) in a list, or in
+        an array of the typecode to save memory """
+        import array
+        nums = array.array(typecode) if typecode else []
+        extend = nums.fromlist if typecode else nums.extend
+        for words in self.chunks(count):
+            extend(list(map(int, words)))
+        return nums
+
+    def columns(self, rows, cols, typecode=None):
+        """ Next rows of cols integers each, de-interleaved into columns """
+        import array
+        result = [array.array(typecode) if typecode else []
+                  for i in range(cols)]
+        extends = [col.fromlist if typecode else col.extend for col in result]
+        read = 0
+        for words in self.chunks(rows * cols):
+            phase = read % cols
+            for i in range(cols):
+                extends[i](list(map(int, words[(i - phase) % cols::cols])))
+            read += len(words)
+        return result
+
+    def lines(self):
+        """ Iterator over all the input lines (independent of the tokens) """
+        return (line.decode().rstrip("\r")
+                for line in self.data.split(b"\n"))
+
+
+class Writer:
+    """ Output lines collected and joined into a single string """
+
+    def __init__(self):
+        """ Default constructor """
+        self.out = []
+
+    def line(self, *values):
+        """ Add a line of space separated values """
+        self.out.append(" ".join(map(str, values)))
+
+    def lines(self, values):
+        """ Add a line for each of the values """
+        self.out.extend(map(str, values))
+
+    def __str__(self):
+        return "\n".join(self.out)
+
 ###############################################################################
 # __Class__ Class (Main Program)
 ###############################################################################
@@ -15,29 +116,124 @@ class __Class__:
     def __init__(self, test_inputs=None):
         """ Default constructor """
 
-        it = iter(test_inputs.split("\n")) if test_inputs else None
-
-        def uinput():
-            return next(it) if it else sys.stdin.readline().rstrip()
+        # Test inputs and stdin are read the same way
+        inp = Reader(test_inputs)
 
         # Reading single elements
-        [self.n, self.m] = map(int, uinput().split())
+        [self.n, self.m] = inp.ints(2)
 
         # Reading multiple number of lines of the same number of elements each
-        l, s = self.n, 2
-        inp = (" ".join(uinput() for i in range(l))).split()
-        self.numm = [[int(inp[i]) for i in range(j, l*s, s)] for j in range(s)]
+        self.numm = inp.columns(self.n, 2)
         self.numa, self.numb = self.numm
 
         # Reading a single line of multiple elements
-        self.nums = list(map(int, uinput().split()))
+        self.nums = inp.ints(self.m)
 
     def calculate(self):
         """ Main calcualtion function of the class """
 
         result = 0
 
-        return str(result)
+        # Multiple lines of output are collected by a Writer
+        out = Writer()
+        out.line(result)
+
+        return str(out)
+
+###############################################################################
+# Benchmark Class
+###############################################################################
+
+
+class Benchmark:
+    """ Times the program phases over repeated runs """
+
+    def __init__(self, repeat=5, warmup=1, cpu=None):
+        """ Default constructor, cpu is the CPU number to pin the runs to """
+        self.repeat = repeat
+        self.warmup = warmup
+        self.cpu = cpu
+
+    def run(self, *phases):
+        """ Run the (name, function) phases in order, each function gets the
+        result of the previous phase. Return {name: (median, IQR)} of the
+        phase times and of their "total" """
+        import gc
+        import os
+        import timeit
+
+        times = dict((name, []) for name, func in phases)
+        times["total"] = []
+        affinity = None
+        if self.cpu is not None and hasattr(os, "sched_setaffinity"):
+            affinity = os.sched_getaffinity(0)
+            os.sched_setaffinity(0, {self.cpu})
+        gc_enabled = gc.isenabled()
+        try:
+            for run in range(self.warmup + self.repeat):
+                # Collect the garbage of the previous run before timing
+                result = None
+                gc.collect()
+                gc.disable()
+                total = 0
+                for name, func in phases:
+                    start = timeit.default_timer()
+                    value = func(result)
+                    elapsed = timeit.default_timer() - start
+                    # The previous result is freed outside of the timing
+                    result = value
+                    total += elapsed
+                    if run >= self.warmup:
+                        times[name].append(elapsed)
+                if run >= self.warmup:
+                    times["total"].append(total)
+                if gc_enabled:
+                    gc.enable()
+        finally:
+            if gc_enabled:
+                gc.enable()
+            if affinity is not None:
+                os.sched_setaffinity(0, affinity)
+        return dict((name, self.stats(t)) for name, t in times.items())
+
+    def fit(self, sizes, times):
+        """ Fit the times to the complexity classes of the sizes, return
+        (class name, time function) of the best fit """
+        import math
+        classes = [
+            ("O(1)", lambda n: 1.),
+            ("O(log n)", lambda n: math.log(n)),
+            ("O(n)", lambda n: float(n)),
+            ("O(n log n)", lambda n: n * math.log(n)),
+            ("O(n^2)", lambda n: float(n) ** 2),
+            ("O(n^2 log n)", lambda n: float(n) ** 2 * math.log(n)),
+            ("O(n^3)", lambda n: float(n) ** 3)]
+        times = [max(t, 1e-9) for t in times]
+        best = None
+        for name, func in classes:
+            # Least squares of the relative errors of time = coef * func(n)
+            scaled = [func(n) / t for n, t in zip(sizes, times)]
+            coef = sum(scaled) / sum(s * s for s in scaled)
+            error = sum((coef * s - 1) ** 2 for s in scaled)
+            if best is None or error < best[0] * (1 - 1e-9):
+                best = (error, name, func, coef)
+        error, name, func, coef = best
+        return name, lambda n: coef * func(n)
+
+    def stats(self, times):
+        """ Return (median, interquartile range) of the times """
+        import statistics
+        if len(times) < 2:
+            return times[0], 0.
+        quartiles = statistics.quantiles(times, n=4, method="inclusive")
+        return statistics.median(times), quartiles[2] - quartiles[0]
+
+    def report(self, results):
+        """ Format the results as median and IQR of each phase """
+        return ", ".join(
+            name + " {0:.3f}s +- {1:.3f}s".format(*results[name])
+            for name in ["total"] + list(results)[:-1]) + (
+            " (median +- IQR of {0} runs)".format(self.repeat))
 
 ###############################################################################
 # Unit Tests
@@ -74,29 +270,88 @@ class unitTests(unittest.TestCase):
         # self.assertEqual(__Class__(test).calculate(), "0")
 
         # Time limit test
-        # self.time_limit_test(5000)
+        # self.time_limit_test(5000, budget=2.)
 
-    def time_limit_test(self, nmax):
-        """ Timelimit testing """
-        import random
-        import timeit
+        # Parse time and memory of arrays and lists
+        # self.parse_benchmark(200000)
 
-        # Random inputs
+        # Scaling test up to nmax extrapolated to the problem limit
+        # self.scaling_test(5000, limit=200000, budget=2.)
+
+    def time_limit_input(self, nmax):
+        """ Random input of the nmax size """
+        import random
         test = str(nmax) + " " + str(nmax) + "\n"
         numnums = [str(i) + " " + str(i+1) for i in range(nmax)]
         test += "\n".join(numnums) + "\n"
         nums = [random.randint(1, 10000) for i in range(nmax)]
         test += " ".join(map(str, nums)) + "\n"
+        return test
+
+    def time_limit_test(self, nmax, budget=2., cpu=None):
+        """ Timelimit testing, fails if the median time exceeds the budget """
+        # Random inputs
+        test = self.time_limit_input(nmax)
 
         # Run the test
-        start = timeit.default_timer()
-        d = __Class__(test)
-        calc = timeit.default_timer()
-        d.calculate()
-        stop = timeit.default_timer()
-        print("\nTimelimit Test: " +
-              "{0:.3f}s (init {1:.3f}s calc {2:.3f}s)".
-              format(stop-start, calc-start, stop-calc))
+        bench = Benchmark(cpu=cpu)
+        results = bench.run(("init", lambda r: __Class__(test)),
+                            ("calc", lambda d: d.calculate()))
+        print("\nTimelimit Test: " + bench.report(results))
+        self.assertLessEqual(
+            results["total"][0], budget,
+            "Time limit budget of {0}s exceeded".format(budget))
+
+    def parse_benchmark(self, nmax):
+        """ Compare time and memory of parsing into arrays and lists """
+        import tracemalloc
+
+        test = self.time_limit_input(nmax)
+        bench = Benchmark(repeat=3)
+        for typecode in ("q", None):
+            results = bench.run(
+                ("parse", lambda r: Reader(test).columns(nmax, 2, typecode)))
+            tracemalloc.start()
+            columns = Reader(test).columns(nmax, 2, typecode)
+            kept, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(("\n" if typecode else "") + "Parse Benchmark: " +
+                  ("array('" + typecode + "')" if typecode else "list") +
+                  " {0:.3f}s +- {1:.3f}s, kept {2:.1f}MB, peak {3:.1f}MB".
+                  format(results["parse"][0], results["parse"][1],
+                         kept / 1e6, peak / 1e6))
+            del columns
+
+    def scaling_test(self, nmax, limit=None, steps=6, budget=2.):
+        """ Time the inputs of geometric sizes up to nmax, fit the init and
+        calc times to complexity classes and fail if the time extrapolated
+        to the problem limit (nmax by default) exceeds the budget """
+        sizes = [max(2, nmax >> i) for i in reversed(range(steps))]
+        bench = Benchmark(repeat=3)
+        times = {"init": [], "calc": []}
+        for n in sizes:
+            test = self.time_limit_input(n)
+            results = bench.run(("init", lambda r: __Class__(test)),
+                                ("calc", lambda d: d.calculate()))
+            for name in times:
+                times[name].append(results[name][0])
+        limit = limit or nmax
+        fits = []
+        total = 0
+        for name in times:
+            print(("" if fits else "\n") + "Scaling Test: " + name + " " +
+                  ", ".join(
+                      "n={0} {1:.4f}s".format(n, t)
+                      for n, t in zip(sizes, times[name])))
+            complexity, time_func = bench.fit(sizes, times[name])
+            fits.append(name + " " + complexity)
+            total += time_func(limit)
+        print("Scaling Test: best fit " + ", ".join(fits) +
+              ", {0:.3f}s extrapolated to n={1}".format(total, limit))
+        self.assertLessEqual(
+            total, budget,
+            "Time limit budget of {0}s exceeded at n={1} by {2}".format(
+                budget, limit, ", ".join(fits)))
 
 if __name__ == "__main__":
 
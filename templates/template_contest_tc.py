@@ -26,6 +26,101 @@ class __Class__:
         """ Main calcualtion function of the class """
         return self.REPLACE_ME(self.test_inputs)
 
+###############################################################################
+# Benchmark Class
+###############################################################################
+
+
+class Benchmark:
+    """ Times the program phases over repeated runs """
+
+    def __init__(self, repeat=5, warmup=1, cpu=None):
+        """ Default constructor, cpu is the CPU number to pin the runs to """
+        self.repeat = repeat
+        self.warmup = warmup
+        self.cpu = cpu
+
+    def run(self, *phases):
+        """ Run the (name, function) phases in order, each function gets the
+        result of the previous phase. Return {name: (median, IQR)} of the
+        phase times and of their "total" """
+        import gc
+        import os
+        import timeit
+
+        times = dict((name, []) for name, func in phases)
+        times["total"] = []
+        affinity = None
+        if self.cpu is not None and hasattr(os, "sched_setaffinity"):
+            affinity = os.sched_getaffinity(0)
+            os.sched_setaffinity(0, {self.cpu})
+        gc_enabled = gc.isenabled()
+        try:
+            for run in range(self.warmup + self.repeat):
+                # Collect the garbage of the previous run before timing
+                result = None
+                gc.collect()
+                gc.disable()
+                total = 0
+                for name, func in phases:
+                    start = timeit.default_timer()
+                    value = func(result)
+                    elapsed = timeit.default_timer() - start
+                    # The previous result is freed outside of the timing
+                    result = value
+                    total += elapsed
+                    if run >= self.warmup:
+                        times[name].append(elapsed)
+                if run >= self.warmup:
+                    times["total"].append(total)
+                if gc_enabled:
+                    gc.enable()
+        finally:
+            if gc_enabled:
+                gc.enable()
+            if affinity is not None:
+                os.sched_setaffinity(0, affinity)
+        return dict((name, self.stats(t)) for name, t in times.items())
+
+    def fit(self, sizes, times):
+        """ Fit the times to the complexity classes of the sizes, return
+        (class name, time function) of the best fit """
+        import math
+        classes = [
+            ("O(1)", lambda n: 1.),
+            ("O(log n)", lambda n: math.log(n)),
+            ("O(n)", lambda n: float(n)),
+            ("O(n log n)", lambda n: n * math.log(n)),
+            ("O(n^2)", lambda n: float(n) ** 2),
+            ("O(n^2 log n)", lambda n: float(n) ** 2 * math.log(n)),
+            ("O(n^3)", lambda n: float(n) ** 3)]
+        times = [max(t, 1e-9) for t in times]
+        best = None
+        for name, func in classes:
+            # Least squares of the relative errors of time = coef * func(n)
+            scaled = [func(n) / t for n, t in zip(sizes, times)]
+            coef = sum(scaled) / sum(s * s for s in scaled)
+            error = sum((coef * s - 1) ** 2 for s in scaled)
+            if best is None or error < best[0] * (1 - 1e-9):
+                best = (error, name, func, coef)
+        error, name, func, coef = best
+        return name, lambda n: coef * func(n)
+
+    def stats(self, times):
+        """ Return (median, interquartile range) of the times """
+        import statistics
+        if len(times) < 2:
+            return times[0], 0.
+        quartiles = statistics.quantiles(times, n=4, method="inclusive")
+        return statistics.median(times), quartiles[2] - quartiles[0]
+
+    def report(self, results):
+        """ Format the results as median and IQR of each phase """
+        return ", ".join(
+            name + " {0:.3f}s +- {1:.3f}s".format(*results[name])
+            for name in ["total"] + list(results)[:-1]) + (
+            " (median +- IQR of {0} runs)".format(self.repeat))
+
 ###############################################################################
 # Unit Tests
 ###############################################################################
@@ -53,25 +148,60 @@ class unitTests(unittest.TestCase):
         # self.assertEqual(__Class__(test).calculate(), 0)
 
         # Time limit test
-        # self.time_limit_test(5000)
+        # self.time_limit_test(5000, budget=2.)
 
-    def time_limit_test(self, nmax):
-        """ Timelimit testing """
+        # Scaling test up to nmax extrapolated to the problem limit
+        # self.scaling_test(5000, limit=200000, budget=2.)
+
+    def time_limit_input(self, nmax):
+        """ Random input of the nmax size """
         import random
-        import timeit
+        return [random.randint(1, 10000) for i in range(nmax)]
 
+    def time_limit_test(self, nmax, budget=2., cpu=None):
+        """ Timelimit testing, fails if the median time exceeds the budget """
         # Random inputs
-        test = [random.randint(1, 10000) for i in range(nmax)]
+        test = self.time_limit_input(nmax)
 
         # Run the test
-        start = timeit.default_timer()
-        d = __Class__(test)
-        calc = timeit.default_timer()
-        d.calculate()
-        stop = timeit.default_timer()
-        print("\nTimelimit Test: " +
-              "{0:.3f}s (init {1:.3f}s calc {2:.3f}s)".
-              format(stop-start, calc-start, stop-calc))
+        bench = Benchmark(cpu=cpu)
+        results = bench.run(("init", lambda r: __Class__(test)),
+                            ("calc", lambda d: d.calculate()))
+        print("\nTimelimit Test: " + bench.report(results))
+        self.assertLessEqual(
+            results["total"][0], budget,
+            "Time limit budget of {0}s exceeded".format(budget))
+
+    def scaling_test(self, nmax, limit=None, steps=6, budget=2.):
+        """ Time the inputs of geometric sizes up to nmax, fit the init and
+        calc times to complexity classes and fail if the time extrapolated
+        to the problem limit (nmax by default) exceeds the budget """
+        sizes = [max(2, nmax >> i) for i in reversed(range(steps))]
+        bench = Benchmark(repeat=3)
+        times = {"init": [], "calc": []}
+        for n in sizes:
+            test = self.time_limit_input(n)
+            results = bench.run(("init", lambda r: __Class__(test)),
+                                ("calc", lambda d: d.calculate()))
+            for name in times:
+                times[name].append(results[name][0])
+        limit = limit or nmax
+        fits = []
+        total = 0
+        for name in times:
+            print(("" if fits else "\n") + "Scaling Test: " + name + " " +
+                  ", ".join(
+                      "n={0} {1:.4f}s".format(n, t)
+                      for n, t in zip(sizes, times[name])))
+            complexity, time_func = bench.fit(sizes, times[name])
+            fits.append(name + " " + complexity)
+            total += time_func(limit)
+        print("Scaling Test: best fit " + ", ".join(fits) +
+              ", {0:.3f}s extrapolated to n={1}".format(total, limit))
+        self.assertLessEqual(
+            total, budget,
+            "Time limit budget of {0}s exceeded at n={1} by {2}".format(
+                budget, limit, ", ".join(fits)))
 
 if __name__ == "__main__":
     unittest.main(argv=[" "])
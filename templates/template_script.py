@@ -70,7 +70,7 @@ class unitTests(unittest.TestCase):
         d.run(test=True)
 
     def test_xcleanup(self):
-        shutil.rmtree(self.tmp_area)
+        shutil.rmtree(self.test_area)
 
 if __name__ == "__main__":
     if sys.argv[-1] == "-ut":
@@ -19,6 +19,26 @@ import getpass
 import shutil
 import datetime
 import time
+import select
+import struct
+import ctypes
+import ctypes.util
+import subprocess
+import functools
+import hashlib
+import threading
+import json
+import signal
+import sysconfig
+import traceback
+import importlib.util
+import io
+import contextlib
+import math
+import multiprocessing
+import cProfile
+import pstats
+import tempfile
 
 
 ###############################################################################
@@ -34,12 +54,15 @@ class Unitframe:
 
     # Configuration
     CFG_UPDATE_PERIOD = .5
+    CFG_DEBOUNCE_PERIOD = .05
     CFG_X_XTERM_OPT = "+aw -bg darkgreen -fg white -geometry 70x20+100+200"
     CFG_CPP_OPTS = "-std=c++11"
+    CFG_CPP_FAST_OPTS = "-O0"
     CFG_CPP_DEBUG_OPTS = (
         "-Wall -Wextra -pedantic -O2 -Wshadow -Wformat=2 " +
         "-Wfloat-equal -Wconversion -Wlogical-op -Wcast-qual -Wcast-align " +
         "-D_GLIBCXX_DEBUG_PEDANTIC -D_FORTIFY_SOURCE=2")
+    CFG_BUILD_CACHE_SIZE = 256 << 20
     CFG_EXTS = {"py": PYTHON, "cc": CPP, "": EXEC}
     CFG_TYPES = {
         "s":   "template_script.py",
@@ -48,6 +71,10 @@ class Unitframe:
         "cf":  "template_contest.py",
         "cfc": "template_contest.cc",
         "ct":  "template_contest_tc.py"}
+    CFG_WATCHERS = ["auto", "inotify", "poll"]
+    CFG_STRESS_CASES = 1000
+    CFG_PROFILE_NMAX = 5000
+    CFG_PROFILE_TOP = 10
 
     # Command constants
     IS_WIN = (os.name == "nt")
@@ -77,6 +104,26 @@ class Unitframe:
         parser.add_argument(
             "-args", action="store", default="",
             help="Passing argument to the Project")
+        parser.add_argument(
+            "-watcher", action="store", default="auto",
+            choices=self.CFG_WATCHERS,
+            help="File watcher backend (default auto)")
+        parser.add_argument(
+            "-worker", action="store_true", default="",
+            help="Run Python unit tests in a persistent interpreter")
+        parser.add_argument(
+            "-stress", action="store", nargs=2, metavar=("GEN", "BRUTE"),
+            help="Compare the Project with a brute-force solution on the " +
+            "inputs printed by a generator")
+        parser.add_argument(
+            "-cases", action="store", type=int, default=self.CFG_STRESS_CASES,
+            help="Number of stress test cases (default " +
+            str(self.CFG_STRESS_CASES) + ")")
+        parser.add_argument(
+            "-profile", action="store", nargs="?", type=int,
+            const=self.CFG_PROFILE_NMAX, metavar="NMAX",
+            help="Profile the time limit test on every save (default NMAX " +
+            str(self.CFG_PROFILE_NMAX) + ")")
         self.args = parser.parse_args(self.arg_str.split())
 
         # Calculate paths
@@ -97,6 +144,27 @@ class Unitframe:
 
         # Project language and extension
         self.language = self.CFG_EXTS[filename_ext(self.args.proj)]
+        self.style_guide = None
+        self.worker = None
+        self.profiler = None
+        self.build_cache = None
+        # Runs are cancelled by killing the process groups of their children
+        self.canceller = Canceller() if hasattr(os, "killpg") else None
+
+        # C++ binaries are built through the cache into a per-user directory
+        if self.language == self.CPP:
+            self.build_cache = BuildCache(
+                size=self.CFG_BUILD_CACHE_SIZE,
+                pch=PchCache(canceller=self.canceller),
+                canceller=self.canceller, link_dir=user_cache_dir("bin"))
+            path_hash = hashlib.sha1(
+                os.path.abspath(self.args.proj).encode()).hexdigest()[:8]
+            self.binary = os.path.join(
+                user_cache_dir("bin"), filename_strip_ext(self.args.proj) +
+                "_" + path_hash + BuildCache.EXE_SUFFIX)
+            self.fast_binary = os.path.join(
+                user_cache_dir("bin"), filename_strip_ext(self.args.proj) +
+                "_" + path_hash + "_fast" + BuildCache.EXE_SUFFIX)
 
     def create_new_project(self, filename):
         """ Create a new project file and replace """
@@ -165,9 +233,7 @@ class Unitframe:
             # Additional commands for python
             if self.language == self.PYTHON:
 
-                # Run PEP8 for python scripts
-                self.cmd += os.path.join(self.checks_dir, "pep8.py")
-                self.cmd += " " + filename + self.CMD_SEP
+                # NOTE: PEP8 checks are run in-process by lint()
 
                 # For Win frame needs to be run by python program
                 if self.IS_WIN:
@@ -175,15 +241,11 @@ class Unitframe:
                 # Use -ut for python scripts
                 prog_cmd += " -ut"
 
-            # Additional commands for C++
+            # C++ binaries are built by build() before running the cmds
             if self.language == self.CPP:
-                binary = "/tmp/" + filename_strip_ext(self.args.proj)
-                binary_exe = os.path.normpath(binary + ".exe")
-                options = self.CFG_CPP_OPTS + " " + self.CFG_CPP_DEBUG_OPTS
-                prog_cmd = "rm -f " + binary_exe + self.CMD_SEP
-                prog_cmd += "g++ " + options + " -o " + binary + " "
-                prog_cmd += filename + self.CMD_SEP
-                prog_cmd += binary + " -ut"
+                prog_cmd = self.binary + " -ut"
+                self.fast_cmd = (self.args.pre + " " + self.fast_binary +
+                                 " -ut " + self.args.args)
 
             # Final cmd string
             self.cmd += self.args.pre + " " + prog_cmd + " " + self.args.args
@@ -199,6 +261,156 @@ class Unitframe:
                     "xterm " + self.CFG_X_XTERM_OPT + " -T '" + filename +
                     "' -e \"" + editor_cmd + " ; " + frame_cmd + "; $SHELL\"&")
 
+    def build(self, filename, fast=False):
+        """ Build the C++ project binary, return (status, compiler output)
+
+        The fast build skips the optimizations and the warnings.
+        """
+        if fast:
+            options = self.CFG_CPP_OPTS + " " + self.CFG_CPP_FAST_OPTS
+            binary = self.fast_binary
+        else:
+            options = self.CFG_CPP_OPTS + " " + self.CFG_CPP_DEBUG_OPTS
+            binary = self.binary
+        status, output, binary = self.build_cache.build(
+            filename, options.split(), binary)
+        return status, output
+
+    def lint(self, filename):
+        """ Run PEP8 checks in-process, return the number of errors """
+        if self.style_guide is None:
+            # Load checks/pep8.py and set up the style guide only once
+            self.pep8 = load_pep8(self.checks_dir)
+            # Only the lines changed since the previous save are re-checked
+            self.style_guide = self.pep8.StyleGuide(
+                paths=[filename], config_file=True, incremental=True)
+        self.style_guide.init_report()
+        errors = self.style_guide.input_file(filename)
+        sys.stdout.flush()
+        return errors
+
+    def run_cycle(self, filename):
+        """ Lint, build and run unit tests of the project once, stop early
+        if the run is cancelled """
+        if self.language == self.PYTHON:
+            self.lint(filename)
+        if self.language == self.CPP:
+            self.run_tiers(filename)
+            return
+        if self.is_cancelled():
+            return
+        if self.worker:
+            self.worker.run(filename, self.args.args.split())
+        else:
+            self.run_cmd(self.cmd)
+        if self.profiler and not self.is_cancelled():
+            self.profile(filename)
+
+    def run_tiers(self, filename):
+        """ Build and test the C++ project without optimizations first, then
+        report the warnings and the results of the full build made in the
+        background meanwhile """
+        status, output = self.build(filename, fast=True)
+        sys.stdout.write(output)
+        if status or self.is_cancelled():
+            return
+        full = []
+        thread = threading.Thread(
+            target=lambda: full.append(self.build(filename)))
+        thread.daemon = True
+        thread.start()
+        self.run_cmd(self.fast_cmd)
+        thread.join()
+        if self.is_cancelled():
+            return
+        status, output = full[0]
+        print("\nFull build" + (" FAILED" if status else "") +
+              ": warnings and unit tests of the optimized binary")
+        sys.stdout.write(output)
+        if status:
+            return
+        self.run_cmd(self.cmd)
+        if self.profiler and not self.is_cancelled():
+            self.profile(filename)
+
+    def is_cancelled(self):
+        """ Return True if a newer save cancelled the current run """
+        return bool(self.canceller and self.canceller.cancelled)
+
+    def run_cmd(self, cmd):
+        """ Run the cmd in its own session, return the exit status """
+        if not self.canceller:
+            return os.system(cmd)
+        sys.stdout.flush()
+        proc = subprocess.Popen(cmd, shell=True, start_new_session=True)
+        self.canceller.start(proc.pid)
+        try:
+            return proc.wait()
+        finally:
+            self.canceller.finish(proc.pid)
+
+    def profile(self, filename):
+        """ Profile the project and print its hot functions """
+        error, stats = self.profiler.profile(filename, self.args.args.split())
+        sys.stdout.write(error or self.profiler.report(stats))
+        sys.stdout.flush()
+
+    def stress(self):
+        """ Run the stress test, return the status """
+        generator, brute = self.args.stress
+        tester = StressTester(
+            [generator, brute, self.args.proj],
+            self.CFG_CPP_OPTS.split() + ["-O2"])
+        error = tester.prepare()
+        if error:
+            sys.stdout.write(error)
+            return 1
+        failures, count, elapsed = tester.run(self.args.cases)
+        rate = " in " + str(round(elapsed, 3)) + "s (" + str(
+            int(count / max(elapsed, 1e-9))) + " cases/s, " + str(
+            tester.jobs) + " jobs)"
+        if not failures:
+            print("Stress: " + str(count) + " cases passed" + rate)
+            return 0
+
+        # The shortest failing input is the easiest one to debug
+        seed, stdin, expected, actual = min(
+            failures, key=lambda f: (len(f[1]), f[0]))
+        print("Stress: MISMATCH on case " + str(seed) + " after " +
+              str(count) + " cases" + rate)
+        print("Stress: the case number is the generator argument and the " +
+              "random seed of Python generators")
+        for title, text in (("Input", stdin), ("Expected", expected),
+                            ("Got", actual)):
+            print(title + ":")
+            print(text.decode(errors="replace").rstrip())
+        return 1
+
+    def wait_save(self, watcher, graph):
+        """ Wait for a save of the project or of its dependencies """
+        watcher.wait()
+        if graph.update():
+            watcher.set_files(graph.files)
+
+    def watch(self, watcher, graph, saved):
+        """ Watcher thread: cancel the current run on every save """
+        while True:
+            self.wait_save(watcher, graph)
+            # Cancelled before the event is set, so the next run is not
+            self.canceller.cancel()
+            saved.set()
+
+    def create_watcher(self, filenames):
+        """ Create a file watcher for the selected backend """
+        if self.args.watcher in ("auto", "inotify"):
+            try:
+                return InotifyWatcher(filenames, self.CFG_DEBOUNCE_PERIOD)
+            except (OSError, AttributeError):
+                # No inotify support, fall back to polling
+                if self.args.watcher == "inotify":
+                    raise
+        return PollWatcher(filenames, self.CFG_UPDATE_PERIOD)
+
     def run(self, test=False):
         """ Main execution function """
 
@@ -213,26 +425,1099 @@ class Unitframe:
         if test:
             return
 
+        if self.args.stress:
+            if self.stress():
+                exit(1)
+            return
+
         if self.args.xterm:
-            watcher_files = [self.args.proj]
-            update = datetime.datetime.min
-            while True:
-                if files_are_modified(watcher_files, update):
-                    update = datetime.datetime.utcnow()
+            # Persistent worker can't wrap the project into a -pre program
+            if (self.args.worker and self.language == self.PYTHON and
+                    hasattr(os, "fork") and not self.args.pre):
+                self.worker = PyWorker(canceller=self.canceller)
+            if self.args.profile and self.language != self.EXEC:
+                self.profiler = Profiler(
+                    self.args.profile,
+                    self.CFG_CPP_OPTS.split() + ["-O2"], self.CFG_PROFILE_TOP,
+                    self.build_cache, self.canceller)
+            # Local imports and includes are watched along with the project
+            graph = DependencyGraph(self.args.proj)
+            watcher = self.create_watcher(graph.files)
+            saved = threading.Event()
+            if self.canceller:
+                # Saves are detected while the project runs and cancel it
+                thread = threading.Thread(
+                    target=self.watch, args=(watcher, graph, saved))
+                thread.daemon = True
+                thread.start()
+            try:
+                while True:
                     os.system(self.CMD_CLEAR)
                     ftime = datetime.datetime.now().strftime('%H:%M:%S')
                     print(ftime + " Running " + self.args.proj)
-                    os.system(self.cmd)
-                time.sleep(self.CFG_UPDATE_PERIOD)
+                    sys.stdout.flush()
+                    self.run_cycle(self.args.proj)
+                    if self.canceller:
+                        saved.wait()
+                        saved.clear()
+                        self.canceller.reset()
+                    else:
+                        self.wait_save(watcher, graph)
+            finally:
+                if self.canceller:
+                    self.canceller.cancel()
+                if self.worker:
+                    self.worker.stop()
         else:
             print("PROJ : ", self.args.proj)
             os.system(self.cmd)
 
+###############################################################################
+# Watcher Classes
+###############################################################################
+
+
+class PollWatcher:
+    """ Detects file updates by polling the modification times """
+
+    def __init__(self, filenames, period=.5):
+        """ Default constructor """
+        self.filenames = list(filenames)
+        self.period = period
+        self.update = datetime.datetime.utcnow()
+
+    def wait(self, timeout=None):
+        """ Wait for updates, return modified files (empty on timeout) """
+        start = time.time()
+        while True:
+            modified = [
+                f for f in self.filenames
+                if os.path.exists(f) and file_is_modified(f, self.update)]
+            if modified:
+                self.update = datetime.datetime.utcnow()
+                return modified
+            if timeout is not None:
+                remaining = start + timeout - time.time()
+                if remaining <= 0:
+                    return []
+                time.sleep(min(self.period, remaining))
+            else:
+                time.sleep(self.period)
+
+    def set_files(self, filenames):
+        """ Replace the watched files """
+        self.filenames = list(filenames)
+
+    def close(self):
+        """ Release watcher resources """
+        pass
+
+
+class InotifyWatcher:
+    """ Waits for file updates using Linux inotify events
+
+    Parent directories are watched instead of the files themselves, so
+    editors replacing the file on save (write + rename) are still detected.
+    A burst of events is collapsed into a single update: events keep being
+    collected until no new event for watched files arrives within the
+    debounce period.
+    """
+
+    # inotify constants (see linux/inotify.h)
+    IN_MODIFY = 0x2
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_Q_OVERFLOW = 0x4000
+    IN_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    IN_EVENT = struct.Struct("iIII")
+
+    def __init__(self, filenames, debounce=.05):
+        """ Default constructor """
+        self.debounce = debounce
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, "inotify_init1: " + os.strerror(errno))
+        self.dirs = {}
+        try:
+            self.set_files(filenames)
+        except OSError:
+            self.close()
+            raise
+
+    def set_files(self, filenames):
+        """ Replace the watched files, watching only their directories """
+        self.filenames = set(os.path.abspath(f) for f in filenames)
+        needed = set(map(os.path.dirname, self.filenames))
+        for wd, dirname in list(self.dirs.items()):
+            if dirname not in needed:
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.dirs[wd]
+        for dirname in sorted(needed - set(self.dirs.values())):
+            wd = self.libc.inotify_add_watch(
+                self.fd, os.fsencode(dirname), self.IN_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, "inotify_add_watch: " + dirname)
+            self.dirs[wd] = dirname
+
+    def read_events(self, timeout):
+        """ Read pending events, return the set of watched files touched """
+        touched = set()
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return touched
+        data = os.read(self.fd, 65536)
+        pos = 0
+        while pos < len(data):
+            wd, mask, cookie, size = self.IN_EVENT.unpack_from(data, pos)
+            pos += self.IN_EVENT.size
+            name = os.fsdecode(data[pos:pos + size].rstrip(b"\0"))
+            pos += size
+            if mask & self.IN_Q_OVERFLOW:
+                touched |= self.filenames
+            elif wd in self.dirs:
+                filename = os.path.join(self.dirs[wd], name)
+                if filename in self.filenames:
+                    touched.add(filename)
+        return touched
+
+    def wait(self, timeout=None):
+        """ Wait for updates, return modified files (empty on timeout) """
+        deadline = None if timeout is None else time.time() + timeout
+        modified = set()
+        while True:
+            if modified:
+                remaining = quiet - time.time()
+            elif deadline is not None:
+                remaining = deadline - time.time()
+            else:
+                remaining = None
+            if remaining is not None and remaining <= 0:
+                return sorted(modified)
+            touched = self.read_events(remaining)
+            if touched:
+                modified |= touched
+                quiet = time.time() + self.debounce
+
+    def close(self):
+        """ Release watcher resources """
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+###############################################################################
+# DependencyGraph Class
+###############################################################################
+
+
+class DependencyGraph:
+    """ Local files a project depends on through imports and includes
+
+    The graph is transitive: dependencies of dependencies are included. The
+    direct dependencies of a file are parsed again only when its
+    modification time or size changes, so updating the graph after every
+    save costs a stat call per file.
+    """
+
+    def __init__(self, root):
+        """ Default constructor """
+        self.root = os.path.abspath(root)
+        self.deps = {}
+        self.files = []
+        self.update()
+
+    def update(self):
+        """ Update the graph, return True if the set of files changed """
+        deps = {}
+        seen = set([self.root])
+        stack = [self.root]
+        while stack:
+            path = stack.pop()
+            try:
+                stat = os.stat(path)
+                key = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                key = None
+            entry = self.deps.get(path)
+            if not entry or entry[0] != key:
+                entry = (key, file_dependencies(path) if key else [])
+            deps[path] = entry
+            for dep in entry[1]:
+                if dep not in seen:
+                    seen.add(dep)
+                    stack.append(dep)
+        self.deps = deps
+        files = sorted(seen)
+        changed = files != self.files
+        self.files = files
+        return changed
+
+###############################################################################
+# PyWorker Class
+###############################################################################
+
+
+class PyWorker:
+    """ Warm interpreter running Python unit tests in-process
+
+    The worker is a forked child which stays alive between runs. Each run
+    loads the project module from scratch and runs its unittest suite. The
+    worker is replaced by a fresh fork if a run leaves the interpreter state
+    polluted (modules imported from outside the Python installation, changed
+    sys.path, working directory or recursion limit) or if it dies.
+
+    Tests failed in the previous run go first, the fastest one first, then
+    the rest in their usual order. A test_xcleanup test always runs last.
+    The run stops at the first failure to report it right away and finishes
+    the remaining tests after that. Failures and durations are kept here, so
+    they survive a fresh worker.
+    """
+
+    def __init__(self, output=None, canceller=None):
+        """ Default constructor, output is an optional fd for the results """
+        self.output = output
+        self.canceller = canceller
+        self.pid = None
+        self.failed = []
+        self.durations = {}
+        self.python_dirs = tuple(set(
+            os.path.realpath(path) + os.sep
+            for path in sysconfig.get_paths().values()))
+
+    def start(self):
+        """ Fork a new worker process """
+        sys.stdout.flush()
+        sys.stderr.flush()
+        req_r, req_w = os.pipe()
+        resp_r, resp_w = os.pipe()
+        pid = fork_group()
+        if not pid:
+            try:
+                os.close(req_w)
+                os.close(resp_r)
+                if self.output is not None:
+                    os.dup2(self.output, 1)
+                    os.dup2(self.output, 2)
+                self.serve(os.fdopen(req_r), os.fdopen(resp_w, "w"))
+            finally:
+                os._exit(0)
+        os.close(req_r)
+        os.close(resp_w)
+        self.pid = pid
+        self.requests = os.fdopen(req_w, "w")
+        self.replies = os.fdopen(resp_r)
+
+    def stop(self):
+        """ Terminate the worker process """
+        if self.pid is None:
+            return
+        for fh in (self.requests, self.replies):
+            try:
+                fh.close()
+            except OSError:
+                pass
+        try:
+            os.killpg(self.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        os.waitpid(self.pid, 0)
+        self.pid = None
+
+    def run(self, filename, args=()):
+        """ Run unit tests of the file in the worker, return the status
+
+        The arguments are passed to the project in sys.argv after -ut.
+        """
+        if self.pid is None:
+            self.start()
+        pid = self.pid
+        if self.canceller:
+            self.canceller.start(pid)
+        try:
+            self.requests.write(json.dumps(
+                [filename, list(args), self.failed, self.durations]) + "\n")
+            self.requests.flush()
+            reply = self.replies.readline()
+        except OSError:
+            reply = ""
+        finally:
+            if self.canceller:
+                self.canceller.finish(pid)
+        if not reply:
+            # Worker died or was cancelled, the next run will fork a new one
+            self.stop()
+            return 1
+        status, polluted, self.failed, self.durations = json.loads(reply)
+        if polluted:
+            self.stop()
+        return status
+
+    def serve(self, requests, replies):
+        """ Worker loop: run requested files until the pipe is closed """
+        for line in requests:
+            filename, args, failed, durations = json.loads(line)
+            state = self.state()
+            argv = sys.argv
+            sys.argv = [filename, "-ut"] + args
+            try:
+                status, failed, durations = self.run_tests(
+                    filename, failed, durations)
+            except BaseException:
+                traceback.print_exc()
+                status = 1
+            finally:
+                sys.argv = argv
+            polluted = self.state() != state
+            sys.stdout.flush()
+            sys.stderr.flush()
+            replies.write(json.dumps(
+                [status, polluted, failed, durations]) + "\n")
+            replies.flush()
+
+    def state(self):
+        """ Interpreter state a project run must not change """
+        modules = set()
+        for name, module in list(sys.modules.items()):
+            path = getattr(module, "__file__", None)
+            if path and not os.path.realpath(path).startswith(
+                    self.python_dirs):
+                modules.add(name)
+        return (modules, list(sys.path), os.getcwd(),
+                sys.getrecursionlimit())
+
+    def run_tests(self, filename, failed, durations):
+        """ Load the module and run its unit tests failed first, return
+        (status, failed test ids, {test id: duration}) """
+        sys.path.insert(0, os.path.dirname(os.path.abspath(filename)))
+        try:
+            spec = importlib.util.spec_from_file_location(
+                "__uframe_project__", filename)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            tests = self.order(
+                self.tests(unittest.defaultTestLoader.loadTestsFromModule(
+                    module)), failed, durations)
+            results = [unittest.TextTestRunner(
+                failfast=True, resultclass=TimedTestResult).run(
+                unittest.TestSuite(tests))]
+            remaining = tests[results[0].testsRun:]
+            if remaining:
+                print("\nFailed first: running the remaining " +
+                      str(len(remaining)) + " tests")
+                results.append(unittest.TextTestRunner(
+                    resultclass=TimedTestResult).run(
+                    unittest.TestSuite(remaining)))
+        finally:
+            del sys.path[0]
+        failed = []
+        durations = {}
+        for result in results:
+            failed += [test.id() for test, trace in
+                       result.errors + result.failures]
+            durations.update(result.durations)
+        status = 0 if all(result.wasSuccessful() for result in results) else 1
+        return status, failed, durations
+
+    def tests(self, suite):
+        """ Flatten the suite into a list of test cases """
+        tests = []
+        for test in suite:
+            if isinstance(test, unittest.TestSuite):
+                tests += self.tests(test)
+            else:
+                tests.append(test)
+        return tests
+
+    def order(self, tests, failed, durations):
+        """ Order the tests: previously failed from the fastest one, then the
+        others in their order, the cleanup test last """
+        failed = set(failed)
+        return sorted(tests, key=lambda test: (
+            test.id().rsplit(".", 1)[-1] == "test_xcleanup",
+            test.id() not in failed,
+            durations.get(test.id(), 0) if test.id() in failed else 0))
+
+
+class TimedTestResult(unittest.TextTestResult):
+    """ Text test result recording the duration of each test """
+
+    def __init__(self, *args, **kwargs):
+        """ Default constructor """
+        super().__init__(*args, **kwargs)
+        self.durations = {}
+        self.start = None
+
+    def startTest(self, test):
+        """ Start the test timer """
+        self.start = time.time()
+        super().startTest(test)
+
+    def stopTest(self, test):
+        """ Record the test duration """
+        super().stopTest(test)
+        self.durations[test.id()] = time.time() - self.start
+
+###############################################################################
+# StressTester Class
+###############################################################################
+
+
+class StressTester:
+    """ Compares solutions on the random inputs printed by a generator
+
+    The programs are the generator, the reference solution and the tested
+    one. The generator gets the case number as its argument (Python ones
+    also get random seeded with it), so every case can be reproduced.
+    Python programs are compiled once and executed in the warm interpreters
+    of a process pool, C++ programs are built once and their binaries are
+    run for each case. Outputs are compared token by token.
+    """
+
+    BATCH = 64
+
+    def __init__(self, programs, options, jobs=None, build_cache=None):
+        """ Default constructor """
+        self.programs = programs
+        self.options = options
+        self.jobs = jobs or os.cpu_count() or 1
+        self.build_cache = build_cache
+        self.runners = []
+
+    def prepare(self):
+        """ Compile the programs, return the error output on failure """
+        for program in self.programs:
+            ext = filename_ext(program)
+            if ext == "py":
+                with open(program, "rb") as fh:
+                    try:
+                        code = compile(fh.read(), program, "exec")
+                    except SyntaxError:
+                        return traceback.format_exc()
+                self.runners.append(("py", code, program))
+            elif ext == "cc":
+                if not self.build_cache:
+                    self.build_cache = BuildCache(pch=PchCache())
+                status, output, binary = self.build_cache.build(
+                    program, self.options)
+                if status:
+                    return output
+                self.runners.append(("bin", binary, program))
+            else:
+                self.runners.append(("bin", os.path.abspath(program), program))
+        return None
+
+    def run_program(self, runner, args, stdin):
+        """ Run a prepared program, return (status, stdout bytes) """
+        kind, target, program = runner
+        if kind == "bin":
+            try:
+                proc = subprocess.run(
+                    [target] + args, input=stdin, stdout=subprocess.PIPE)
+            except OSError as e:
+                return 1, str(e).encode()
+            return proc.returncode, proc.stdout
+
+        # Python programs are executed in this interpreter
+        stdout = io.BytesIO()
+        saved = sys.stdin, sys.stdout, sys.argv
+        sys.stdin = io.TextIOWrapper(io.BytesIO(stdin))
+        sys.stdout = io.TextIOWrapper(stdout, write_through=True)
+        sys.argv = [program] + args
+        status = 0
+        try:
+            exec(target, {"__name__": "__main__", "__file__": program})
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else int(
+                e.code is not None)
+        except Exception:
+            traceback.print_exc(file=sys.stdout)
+            status = 1
+        finally:
+            sys.stdout.flush()
+            # Detached wrapper doesn't close the output buffer
+            sys.stdout.detach()
+            sys.stdin, sys.stdout, sys.argv = saved
+        return status, stdout.getvalue()
+
+    def run_case(self, seed):
+        """ Run a case, return None if the solutions agree or
+        (seed, input, expected output, actual output) """
+        generator, brute, project = self.runners
+        random.seed(seed)
+        status, stdin = self.run_program(generator, [str(seed)], b"")
+        if status:
+            return seed, b"", b"Generator failed", stdin
+        status, expected = self.run_program(brute, [], stdin)
+        if status:
+            return seed, stdin, b"Brute-force solution failed", expected
+        status, actual = self.run_program(project, [], stdin)
+        if status or actual.split() != expected.split():
+            return seed, stdin, expected, actual
+        return None
+
+    def run(self, cases):
+        """ Run the cases in batches until a batch has a failure, return
+        (failures, number of cases run, elapsed time) """
+        global _stress_tester
+        _stress_tester = self
+        # Python programs can import the modules next to them
+        paths = sorted(set(os.path.dirname(os.path.abspath(program))
+                           for program in self.programs))
+        sys.path[:0] = paths
+        start = time.time()
+        pool = None
+        if self.jobs > 1 and hasattr(os, "fork"):
+            pool = multiprocessing.get_context("fork").Pool(self.jobs)
+        count = 0
+        failures = []
+        try:
+            batch = self.BATCH * self.jobs
+            for first in range(1, cases + 1, batch):
+                seeds = range(first, min(first + batch, cases + 1))
+                if pool:
+                    results = pool.map(_stress_case, seeds, self.BATCH // 4)
+                else:
+                    results = map(_stress_case, seeds)
+                failures = [result for result in results if result]
+                count += len(seeds)
+                if failures:
+                    break
+        finally:
+            if pool:
+                pool.terminate()
+                pool.join()
+            del sys.path[:len(paths)]
+        return failures, count, time.time() - start
+
+
+_stress_tester = None
+
+
+def _stress_case(seed):
+    """ Run a stress test case in a pool process """
+    return _stress_tester.run_case(seed)
+
+###############################################################################
+# Profiler Class
+###############################################################################
+
+
+class Profiler:
+    """ Profiles the time limit scenario of the project on every save
+
+    Python projects run time_limit_test(nmax) of their unit tests (the whole
+    unit test suite if there is none) under cProfile in a forked child.
+    C++ projects are built with -pg, their unit tests are run and gprof
+    reads the call graph. The hot functions are reported by cumulative and
+    self time together with the change since the previous profile.
+    """
+
+    GRAPH_RE = re.compile(
+        "^\\[\\d+\\]\\s+[\\d.]+\\s+([\\d.]+)\\s+([\\d.]+)\\s+" +
+        "(?:[\\d+/]+\\s+)?(.*?)\\s+\\[\\d+\\]$")
+    WIDTH = 48
+
+    def __init__(self, nmax, options, top=10, build_cache=None,
+                 canceller=None):
+        """ Default constructor, options are the C++ build options """
+        self.nmax = nmax
+        self.options = options
+        self.top = top
+        self.build_cache = build_cache
+        self.canceller = canceller
+        self.previous = None
+
+    def profile(self, filename, args=()):
+        """ Profile the project, return (error output, stats) where stats
+        are {function: (cumulative time, self time)} """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            if filename_ext(filename) == "py":
+                return self.profile_python(filename, tmp_dir)
+            return self.profile_cpp(filename, args, tmp_dir)
+
+    def profile_python(self, filename, tmp_dir):
+        """ Profile a Python project in a forked child """
+        if not hasattr(os, "fork"):
+            return "Profiling Python projects needs os.fork\n", None
+        stats_file = os.path.join(tmp_dir, "profile.stats")
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = fork_group()
+        if not pid:
+            status = 1
+            try:
+                # Test output is already shown by the unit test run
+                devnull = os.open(os.devnull, os.O_WRONLY)
+                os.dup2(devnull, 1)
+                os.dup2(devnull, 2)
+                self.run_python(filename, stats_file)
+                status = 0
+            finally:
+                os._exit(status)
+        if self.canceller:
+            self.canceller.start(pid)
+        try:
+            os.waitpid(pid, 0)
+        finally:
+            if self.canceller:
+                self.canceller.finish(pid)
+        if not os.path.exists(stats_file):
+            return "Profile: can't load " + filename + "\n", None
+
+        stats = {}
+        for func, (cc, nc, tt, ct, callers) in pstats.Stats(
+                stats_file).stats.items():
+            path, line, name = func
+            if path == "~":
+                label = name
+            elif os.path.abspath(path) == os.path.abspath(__file__):
+                # Skip the profiler's own wrappers
+                continue
+            else:
+                label = name + " (" + os.path.basename(path) + ":" + str(
+                    line) + ")"
+            stats[label] = (ct, tt)
+        return None, stats
+
+    def run_python(self, filename, stats_file):
+        """ Load the module and run its scenario under cProfile """
+        sys.path.insert(0, os.path.dirname(os.path.abspath(filename)))
+        spec = importlib.util.spec_from_file_location(
+            "__uframe_project__", filename)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        tests = getattr(module, "unitTests", None)
+        if tests and hasattr(tests, "time_limit_test"):
+            def scenario():
+                tests("time_limit_test").time_limit_test(self.nmax)
+        else:
+            suite = unittest.defaultTestLoader.loadTestsFromModule(module)
+
+            def scenario():
+                unittest.TextTestRunner().run(suite)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            scenario()
+        except AssertionError:
+            # Exceeded time budget still gives a useful profile
+            pass
+        finally:
+            profiler.disable()
+            profiler.dump_stats(stats_file)
+
+    def profile_cpp(self, filename, args, tmp_dir):
+        """ Build the project with -pg, run its unit tests and read gprof """
+        if not self.build_cache:
+            self.build_cache = BuildCache(pch=PchCache())
+        status, output, binary = self.build_cache.build(
+            filename, self.options + ["-pg"])
+        if status:
+            return output, None
+        try:
+            # gmon.out is written to the working directory of the run
+            run_child([binary, "-ut"] + list(args), self.canceller,
+                      cwd=tmp_dir, stderr=subprocess.DEVNULL)
+            status, stdout, usage = run_child(
+                ["gprof", "-b", "-q", binary,
+                 os.path.join(tmp_dir, "gmon.out")],
+                self.canceller, stderr=subprocess.STDOUT)
+        except OSError as e:
+            return "Profile: " + str(e) + "\n", None
+        text = stdout.decode(errors="replace")
+        if status:
+            return text, None
+
+        stats = {}
+        for line in text.splitlines():
+            m = self.GRAPH_RE.match(line)
+            if m:
+                self_time, children = float(m.group(1)), float(m.group(2))
+                stats[m.group(3)] = (self_time + children, self_time)
+        return None, stats
+
+    def report(self, stats):
+        """ Format the top functions by cumulative and self time with the
+        changes since the previous report """
+        total = sum(self_time for cum, self_time in stats.values())
+        lines = ["Profile: {0:.3f}s".format(total) + (
+            "" if self.previous is None else " ({0:+.3f}s)".format(
+                total - sum(s for c, s in self.previous.values()))) +
+            " total self time"]
+        for index, title in ((0, "cumulative"), (1, "self")):
+            lines.append("Profile: top " + str(self.top) + " by " + title +
+                         " time")
+            top = sorted(stats.items(), key=lambda item: -item[1][index])
+            for label, times in top[:self.top]:
+                if self.previous is None:
+                    delta = ""
+                elif label in self.previous:
+                    delta = "{0:+.3f}s".format(
+                        times[index] - self.previous[label][index])
+                else:
+                    delta = "new"
+                if len(label) > self.WIDTH:
+                    label = label[:self.WIDTH - 3] + "..."
+                lines.append("  {0:7.3f}s {1:>8} ".format(
+                    times[index], delta) + label)
+        self.previous = stats
+        return "\n".join(lines) + "\n"
+
+###############################################################################
+# BuildCache Class
+###############################################################################
+
+
+class BuildCache:
+    """ Cache of compiled binaries with LRU size eviction
+
+    Binaries are keyed by a hash of the preprocessed source, the compiler
+    options and the compiler version, so edits not changing the code seen by
+    the compiler (comments, whitespace in includes) are cache hits as well.
+    Binaries linked out of the cache should live in the link dir, so links
+    to evicted entries are removed with them and free the disk space.
+    """
+
+    EXE_SUFFIX = ".exe" if os.name == "nt" else ""
+
+    def __init__(self, compiler="g++", size=256 << 20, cache_dir=None,
+                 pch=None, canceller=None, link_dir=None):
+        """ Default constructor """
+        self.compiler = compiler
+        self.size = size
+        self.cache_dir = cache_dir or user_cache_dir("build")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.pch = pch
+        self.canceller = canceller
+        self.link_dir = link_dir
+        self.hits = 0
+
+    def key(self, filename, options, usage=None):
+        """ Return the cache key, None if the source can't be preprocessed """
+        try:
+            status, stdout, key_usage = run_child(
+                [self.compiler] + options + ["-E", filename],
+                self.canceller, stderr=subprocess.DEVNULL)
+        except OSError:
+            return None
+        if usage:
+            usage.add(key_usage)
+        if status:
+            return None
+        digest = hashlib.sha256(stdout)
+        digest.update(b"\0" + " ".join(options).encode())
+        digest.update(b"\0" + compiler_version(self.compiler).encode())
+        return digest.hexdigest()
+
+    def build(self, filename, options, binary=None, usage=None, key=None):
+        """ Build the file, return (status, compiler output, binary)
+
+        The binary is the cache entry itself unless a binary path is given,
+        in which case the entry is linked to that path. Compiler warnings are
+        stored next to the entry and replayed on cache hits. Resources used
+        by the compiler are added to the usage if one is given. A key already
+        computed by the key method saves preprocessing the file again.
+        """
+        if key is None:
+            key = self.key(filename, options, usage)
+        unique = str(os.getpid()) + "_" + str(threading.get_ident())
+        entry = os.path.join(
+            self.cache_dir, (key or "nokey_" + unique) + self.EXE_SUFFIX)
+        log = entry + ".log"
+
+        if key and os.path.exists(entry):
+            self.hits += 1
+            os.utime(entry)
+            output = ""
+            if os.path.exists(log):
+                os.utime(log)
+                with open(log) as fh:
+                    output = fh.read()
+        else:
+            tmp_entry = os.path.join(
+                self.cache_dir, "tmp_" + unique + self.EXE_SUFFIX)
+            build_options = options
+            if self.pch and self.pch.is_used(filename):
+                pch_dir = self.pch.include_dir(options, usage)
+                if pch_dir:
+                    build_options = ["-I", pch_dir] + options
+            try:
+                status, stdout, build_usage = run_child(
+                    [self.compiler] + build_options +
+                    ["-o", tmp_entry, filename], self.canceller,
+                    stderr=subprocess.STDOUT)
+            except OSError as e:
+                return 1, "Can't run " + self.compiler + ": " + str(e), None
+            if usage:
+                usage.add(build_usage)
+            output = stdout.decode(errors="replace")
+            if status:
+                return status, output, None
+            if output:
+                with open(log, "w") as fh:
+                    fh.write(output)
+            os.replace(tmp_entry, entry)
+            self.evict(keep=entry)
+
+        if binary:
+            return 0, output, link_file(entry, binary)
+        return 0, output, entry
+
+    def evict(self, keep=None):
+        """ Remove least recently used entries above the size limit
+
+        An entry and its warnings log are sized and removed together, logs
+        left without their entry are removed.
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith(".log"):
+                if not os.path.exists(path[:-len(".log")]):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            size = stat.st_size
+            if os.path.exists(path + ".log"):
+                size += os.path.getsize(path + ".log")
+            total += size
+            if path != keep:
+                entries.append((stat.st_mtime, size, path))
+        removed = False
+        for mtime, size, path in sorted(entries):
+            if total <= self.size:
+                break
+            for name in (path + ".log", path):
+                try:
+                    os.remove(name)
+                    removed = True
+                except OSError:
+                    pass
+            total -= size
+
+        # Links (or copies) left with a single name outlived their entry
+        if removed and self.link_dir:
+            for name in os.listdir(self.link_dir):
+                path = os.path.join(self.link_dir, name)
+                try:
+                    if os.stat(path).st_nlink == 1:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+###############################################################################
+# PchCache Class
+###############################################################################
+
+
+class PchCache:
+    """ Precompiled standard header maintained for each set of options
+
+    The header is precompiled into <key>/<header>.gch where the key hashes the
+    options and the compiler version, so changing either of them builds a
+    new one. Passing -I <key> to the compiler makes it pick the precompiled
+    header up in place of the standard one.
+    """
+
+    def __init__(self, header="bits/stdc++.h", compiler="g++", keep=4,
+                 cache_dir=None, canceller=None):
+        """ Default constructor """
+        self.header = header
+        self.canceller = canceller
+        self.compiler = compiler
+        self.keep = keep
+        self.cache_dir = cache_dir or user_cache_dir("pch")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.include_re = re.compile(
+            "^\\s*#\\s*include\\s*<" + re.escape(header) + ">")
+        self.lock = threading.Lock()
+
+    def is_used(self, filename):
+        """ Return True if the source includes the header """
+        with open(filename, errors="replace") as fh:
+            return any(self.include_re.match(line) for line in fh)
+
+    def include_dir(self, options, usage=None):
+        """ Return the include dir with the precompiled header for the
+        options, build it if needed (None if it can't be built) """
+        digest = hashlib.sha256(self.header.encode())
+        digest.update(b"\0" + " ".join(options).encode())
+        digest.update(b"\0" + compiler_version(self.compiler).encode())
+        pch_dir = os.path.join(self.cache_dir, digest.hexdigest()[:16])
+        gch = os.path.join(pch_dir, self.header + ".gch")
+
+        with self.lock:
+            if os.path.exists(gch):
+                os.utime(pch_dir)
+                return pch_dir
+            os.makedirs(os.path.dirname(gch), exist_ok=True)
+            # Other processes may build the same header at the same time
+            unique = str(os.getpid()) + "_" + str(threading.get_ident())
+            source = os.path.join(pch_dir, "pch_" + unique + ".h")
+            tmp = gch + ".tmp" + unique
+            with open(source, "w") as fh:
+                fh.write("#include <" + self.header + ">\n")
+            try:
+                status, stdout, pch_usage = run_child(
+                    [self.compiler] + options +
+                    ["-x", "c++-header", source, "-o", tmp],
+                    self.canceller, stderr=subprocess.DEVNULL)
+            except OSError:
+                status = None
+            finally:
+                os.remove(source)
+            if status is not None and usage:
+                usage.add(pch_usage)
+            if status != 0:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                return None
+            os.replace(tmp, gch)
+            self.evict(pch_dir)
+            return pch_dir
+
+    def evict(self, keep_dir):
+        """ Keep only the most recently used precompiled headers """
+        dirs = [os.path.join(self.cache_dir, d)
+                for d in os.listdir(self.cache_dir)]
+        dirs = sorted((os.path.getmtime(d), d) for d in dirs if d != keep_dir)
+        for mtime, pch_dir in dirs[:max(0, len(dirs) + 1 - self.keep)]:
+            shutil.rmtree(pch_dir, ignore_errors=True)
+
+###############################################################################
+# Canceller Class
+###############################################################################
+
+
+class Canceller:
+    """ Process groups of the current run, killed when the run is cancelled
+
+    Children are started in their own process groups (sessions), so killing
+    a group also kills whatever the child has spawned. Children registered
+    after the cancellation are killed right away, the run is over once
+    reset() is called.
+    """
+
+    def __init__(self):
+        """ Default constructor """
+        self.lock = threading.Lock()
+        self.pids = set()
+        self.cancelled = False
+
+    def start(self, pid):
+        """ Register the process group of a started child """
+        with self.lock:
+            self.pids.add(pid)
+            if self.cancelled:
+                self.kill(pid)
+
+    def finish(self, pid):
+        """ Unregister the process group of a reaped child """
+        with self.lock:
+            self.pids.discard(pid)
+
+    def cancel(self):
+        """ Kill the registered process groups and the ones started later """
+        with self.lock:
+            self.cancelled = True
+            for pid in self.pids:
+                self.kill(pid)
+
+    def reset(self):
+        """ Start a new run """
+        with self.lock:
+            self.cancelled = False
+
+    def kill(self, pid):
+        """ Kill a process group """
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+###############################################################################
+# Usage Class
+###############################################################################
+
+
+class Usage:
+    """ Resources used by child processes: CPU and wall seconds, max RSS KB """
+
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    RSS_DIVISOR = 1024 if sys.platform == "darwin" else 1
+
+    def __init__(self, utime=0., stime=0., wall=0., maxrss=0):
+        """ Default constructor """
+        self.utime = utime
+        self.stime = stime
+        self.wall = wall
+        self.maxrss = maxrss
+
+    def add(self, other):
+        """ Add the usage of another process run after this one """
+        self.utime += other.utime
+        self.stime += other.stime
+        self.wall += other.wall
+        self.maxrss = max(self.maxrss, other.maxrss)
+
 ###############################################################################
 # Helping functions
 ###############################################################################
 
 
+def run_child(args, canceller=None, **kwargs):
+    """ Run a child process, return (status, stdout bytes, Usage)
+
+    The child is reaped with os.wait4, so the usage holds its own CPU times
+    and peak memory (only the wall time is known on Windows). With a
+    canceller the child runs in its own session registered to it.
+    """
+    start = time.time()
+    if canceller:
+        kwargs["start_new_session"] = True
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE, **kwargs)
+    if canceller:
+        canceller.start(proc.pid)
+    try:
+        with proc.stdout:
+            stdout = proc.stdout.read()
+        if hasattr(os, "wait4"):
+            pid, status, ru = os.wait4(proc.pid, 0)
+            if os.WIFSIGNALED(status):
+                proc.returncode = -os.WTERMSIG(status)
+            else:
+                proc.returncode = os.WEXITSTATUS(status)
+            usage = Usage(ru.ru_utime, ru.ru_stime, time.time() - start,
+                          ru.ru_maxrss // Usage.RSS_DIVISOR)
+        else:
+            proc.wait()
+            usage = Usage(wall=time.time() - start)
+    finally:
+        if canceller:
+            canceller.finish(proc.pid)
+    return proc.returncode, stdout, usage
+
+
+def fork_group():
+    """ Fork a child leading its own process group, return the fork result """
+    pid = os.fork()
+    try:
+        # Set in both processes, so the group exists once either one returns
+        os.setpgid(pid, 0)
+    except OSError:
+        pass
+    return pid
+
+
 def search_file(pattern, filename):
     """ Search file and return only the first match """
     if not os.path.exists(filename):
@@ -275,6 +1560,110 @@ def filename_ext(filename):
     return os.path.splitext(base)[1][1:]
 
 
+def file_dependencies(filename):
+    """ Return local files imported (Python) or included (C++) by a file """
+    base = os.path.dirname(os.path.abspath(filename))
+    try:
+        with open(filename, errors="replace") as fh:
+            text = fh.read()
+    except OSError:
+        return []
+
+    # Candidate paths without extensions
+    candidates = []
+    if filename_ext(filename) == "py":
+        for m in re.finditer("^[ \t]*import[ \t]+([\w., \t]+)", text, re.M):
+            for name in m.group(1).split(","):
+                if name.split():
+                    candidates.append((base, name.split()[0]))
+        pattern = "^[ \t]*from[ \t]+(\.*)([\w.]*)[ \t]+import[ \t(]+([\w, ]+)"
+        for m in re.finditer(pattern, text, re.M):
+            dots, module, names = m.groups()
+            root = base
+            for i in range(len(dots) - 1):
+                root = os.path.dirname(root)
+            if module:
+                candidates.append((root, module))
+            # Imported names may be submodules of the package
+            for name in names.split(","):
+                if name.split():
+                    candidates.append(
+                        (root, ".".join(filter(None, [
+                            module, name.split()[0]]))))
+        # Importing a submodule runs the __init__ of its parent packages
+        for root, name in list(candidates):
+            parts = name.split(".")
+            for i in range(1, len(parts)):
+                candidates.append((root, ".".join(parts[:i])))
+        exts = [".py", os.sep + "__init__.py"]
+    else:
+        for m in re.finditer("^[ \t]*#[ \t]*include[ \t]*\"([^\"]+)\"",
+                             text, re.M):
+            candidates.append((base, m.group(1)))
+        exts = [""]
+
+    deps = set()
+    for root, name in candidates:
+        if exts[0]:
+            name = name.replace(".", os.sep)
+        for ext in exts:
+            path = os.path.normpath(os.path.join(root, name + ext))
+            if os.path.isfile(path):
+                deps.add(path)
+                break
+    deps.discard(os.path.abspath(filename))
+    return sorted(deps)
+
+
+def load_pep8(checks_dir):
+    """ Load checks/pep8.py as the pep8 module """
+    spec = importlib.util.spec_from_file_location(
+        "pep8", os.path.join(checks_dir, "pep8.py"))
+    module = importlib.util.module_from_spec(spec)
+    # Check registry looks the module up in sys.modules
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def link_file(src, dst):
+    """ Atomically replace dst with a hard link (or a copy) of src """
+    # Renaming over a link to the same file would leave the tmp link behind
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        return dst
+    tmp = dst + ".tmp" + str(os.getpid())
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copy2(src, tmp)
+    os.replace(tmp, dst)
+    return dst
+
+
+def user_cache_dir(*subdirs):
+    """ Return the per-user cache directory (created if missing) """
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = (os.environ.get("XDG_CACHE_HOME") or
+                os.path.expanduser("~/.cache"))
+    path = os.path.join(base, "unitframe", *subdirs)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+@functools.lru_cache()
+def compiler_version(compiler):
+    """ Return the version banner of the compiler, empty if not found """
+    try:
+        proc = subprocess.run(
+            [compiler, "--version"],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except OSError:
+        return ""
+    return proc.stdout.decode(errors="replace").strip()
+
+
 def file_get_mdatetime(filename):
     """ Calulating the modification datetime of the file """
     return datetime.datetime.utcfromtimestamp(os.path.getmtime(filename))
@@ -286,14 +1675,6 @@ def file_is_modified(filename, lastupdate):
     update = file_get_mdatetime(filename)
     return now >= update and update >= lastupdate
 
-
-def files_are_modified(filenames, lastupdate):
-    """ Return true if one of files was modified """
-    for filename in filenames:
-        if file_is_modified(filename, lastupdate):
-            return True
-    return False
-
 ###############################################################################
 # Unit Tests
 ###############################################################################
@@ -310,6 +1691,14 @@ class unitTests(unittest.TestCase):
 
     def setUp(self):
         os.makedirs(self.test_area, exist_ok=True)
+        # Caches and indexes of the tested objects stay in the test area
+        self.environ = dict(os.environ)
+        os.environ["XDG_CACHE_HOME"] = self.test_area + "/cache"
+        os.environ["LOCALAPPDATA"] = self.test_area + "/cache"
+
+    def tearDown(self):
+        os.environ.clear()
+        os.environ.update(self.environ)
 
     def test_Unitframe_class__basic_functions(self):
         """ Basic functions """
@@ -357,6 +1746,98 @@ class unitTests(unittest.TestCase):
                 "cat " + os.path.normpath(cpp_file) +
                 "| grep \"namespace std\" -q"), 0)
 
+    def test_templates__benchmark(self):
+        """ Contest templates benchmark harness and time limit test """
+        templates_dir = Unitframe("x").templates_dir
+        # Pin to a CPU this process is allowed to run on
+        cpu = None
+        if hasattr(os, "sched_getaffinity"):
+            cpu = min(os.sched_getaffinity(0))
+        for name in ("template_contest.py", "template_contest_tc.py"):
+            spec = importlib.util.spec_from_file_location(
+                "template", os.path.join(templates_dir, name))
+            template = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(template)
+
+            bench = template.Benchmark(repeat=3, cpu=cpu)
+            calls = []
+            results = bench.run(("a", lambda r: calls.append(r) or 1),
+                                ("b", lambda r: calls.append(r)))
+            self.assertEqual(calls, [None, 1] * 4)
+            self.assertEqual(list(results), ["a", "b", "total"])
+            self.assertEqual(bench.stats([3., 1., 2.]), (2., 1.))
+            self.assertIn("total ", bench.report(results))
+
+            test = template.unitTests("time_limit_test")
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                test.time_limit_test(100)
+                self.assertRaises(
+                    AssertionError, test.time_limit_test, 100, budget=0)
+            self.assertIn("Timelimit Test: total ", out.getvalue())
+            if hasattr(test, "parse_benchmark"):
+                with contextlib.redirect_stdout(out):
+                    test.parse_benchmark(100)
+                self.assertIn("Parse Benchmark: list ", out.getvalue())
+
+            # Complexity fits and the scaling test
+            sizes = [1000 << i for i in range(5)]
+            for name, func in (("O(n)", lambda n: 1e-7 * n),
+                               ("O(n log n)", lambda n: n * math.log(n)),
+                               ("O(n^2)", lambda n: 3e-9 * n * n)):
+                complexity, time_func = bench.fit(
+                    sizes, [func(n) for n in sizes])
+                self.assertEqual(complexity, name)
+                self.assertAlmostEqual(time_func(10 ** 6) / func(10 ** 6), 1)
+            with contextlib.redirect_stdout(out):
+                test.scaling_test(400, steps=3)
+                self.assertRaises(
+                    AssertionError, test.scaling_test, 400, steps=3,
+                    budget=0)
+            self.assertIn("Scaling Test: best fit init ", out.getvalue())
+
+    def test_templates__reader(self):
+        """ Contest template fast input and output """
+        spec = importlib.util.spec_from_file_location(
+            "template", os.path.join(
+                Unitframe("x").templates_dir, "template_contest.py"))
+        template = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(template)
+
+        inp = template.Reader("2 x\r\n1 2\n3 4\n5 6 7\n")
+        self.assertEqual(inp.ints(1), [2])
+        self.assertEqual(inp.tokens(1), ["x"])
+        self.assertEqual(inp.columns(2, 2), [[1, 3], [2, 4]])
+        self.assertEqual(inp.ints(), [5, 6, 7])
+        self.assertEqual(inp.ints(), [])
+        self.assertEqual(list(inp.lines()),
+                         ["2 x", "1 2", "3 4", "5 6 7", ""])
+
+        # Tokens split across chunks are read in order into arrays
+        nums = list(range(-50, 50))
+        inp = template.Reader(" ".join(map(str, [9] + nums + nums)))
+        inp.CHUNK = 7
+        self.assertEqual(inp.ints(1, "q").tolist(), [9])
+        self.assertEqual([col.tolist() for col in inp.columns(25, 4, "q")],
+                         [nums[i::4] for i in range(4)])
+        self.assertEqual(inp.ints(10, "q").typecode, "q")
+        self.assertEqual(inp.ints(), nums[10:])
+
+        # Stdin is read as a whole through the binary buffer
+        stdin = sys.stdin
+        try:
+            sys.stdin = io.TextIOWrapper(io.BytesIO(b"1 2\n3 4\n5 6\n"))
+            d = template.__Class__()
+        finally:
+            sys.stdin = stdin
+        self.assertEqual((d.n, d.m, d.numm, d.nums),
+                         (1, 2, [[3], [4]], [5, 6]))
+
+        out = template.Writer()
+        out.line(1, "a", 2.5)
+        out.lines(range(2))
+        self.assertEqual(str(out), "1 a 2.5\n0\n1")
+
     def test_Unitframe_class__set_cmd(self):
         """ Create watcher cmd """
         self.maxDiff = None
@@ -378,12 +1859,526 @@ class unitTests(unittest.TestCase):
         f = Unitframe(proj + " -x -arg arg -pre pre")
         f.set_cmd(proj)
         self.assertEqual(
-            f.cmd, os.path.join(f.checks_dir, "pep8.py") + " " + proj +
-            f.CMD_SEP + "pre " + ("python " if f.IS_WIN else "") +
+            f.cmd, "pre " + ("python " if f.IS_WIN else "") +
             proj + " -ut arg")
 
+        proj = self.tmp_file + "_xcmd.cc"
+        f = Unitframe(proj + " -x -arg arg -pre pre -type pc")
+        f.set_cmd(proj)
+        self.assertEqual(f.cmd, "pre " + f.binary + " -ut arg")
+        self.assertEqual(f.fast_cmd, "pre " + f.fast_binary + " -ut arg")
+
+    def test_Unitframe_class__run_tiers(self):
+        """ Fast C++ build is tested first, then the full one """
+        proj = self.tmp_file + "_tiers.cc"
+        with open(proj, "w") as fh:
+            fh.write("int main() {\n    int unused;\n    return 0;\n}\n")
+        f = Unitframe(proj + " -x")
+        f.set_cmd(proj)
+        f.fast_cmd = f.cmd = "true"
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            f.run_cycle(proj)
+        self.assertEqual(out.getvalue().count("-Wunused-variable"), 1)
+        self.assertIn("\nFull build: warnings and unit tests", out.getvalue())
+        self.assertTrue(os.path.exists(f.fast_binary))
+        self.assertTrue(os.path.exists(f.binary))
+
+        # Compile errors stop the cycle after the fast build
+        with open(proj, "w") as fh:
+            fh.write("int main() { return x; }\n")
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            f.run_cycle(proj)
+        self.assertIn("error", out.getvalue())
+        self.assertNotIn("Full build", out.getvalue())
+
+    def test_Unitframe_class__lint(self):
+        """ In-process PEP8 checks """
+        proj = self.tmp_file + "_lint.py"
+        with open(proj, "w") as fh:
+            fh.write("x=1\n")
+        f = Unitframe(proj + " -x")
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            self.assertEqual(f.lint(proj), 1)
+            style_guide = f.style_guide
+            with open(proj, "w") as fh:
+                fh.write("x = 1\n")
+            self.assertEqual(f.lint(proj), 0)
+        self.assertIs(f.style_guide, style_guide)
+        self.assertEqual(
+            out.getvalue(), proj + ":1:2: E225 missing whitespace " +
+            "around operator\n")
+
+    def test_pep8_incremental(self):
+        """ PEP8 incremental checks report the same as full ones """
+        pep8 = load_pep8(Unitframe("x").checks_dir)
+        source = pep8.readlines(__file__)
+        edits = [(0, 0, "x=1\n"), (30, 31, ""), (200, 200, "\n\n\n"),
+                 (400, 401, "    def f( ):\n"), (-1, -1, "\tz = 1\n")]
+        results = {}
+        for incremental in (False, True):
+            style_guide = pep8.StyleGuide(quiet=2, incremental=incremental)
+            results[incremental] = []
+            lines = list(source)
+            for start, stop, text in edits:
+                lines[start:stop] = [text] if text else []
+                report = style_guide.init_report()
+                style_guide.input_file(__file__, lines=list(lines))
+                results[incremental].append(
+                    (report.total_errors, report.counters))
+        self.assertEqual(results[True], results[False])
+
+    def test_pep8_dispatch(self):
+        """ PEP8 compiled check dispatchers call checks like run_check """
+        pep8 = load_pep8(Unitframe("x").checks_dir)
+        options = pep8.StyleGuide(quiet=2).options
+        checker = pep8.Checker(lines=["x=1 \n"], options=options,
+                               report=pep8.BaseReport(options))
+        checker.check_all()
+        checker.physical_line = "x=1 \n"
+        dispatchers = options.physical_dispatch + options.logical_dispatch
+        checks = options.physical_checks + options.logical_checks
+        self.assertEqual(len(dispatchers), len(checks))
+        for (name, check, dispatch), (__, __, args) in zip(
+                dispatchers, checks):
+            results = [dispatch(checker), checker.run_check(check, args)]
+            if (name, check, args) in options.logical_checks:
+                results = [list(result or ()) for result in results]
+            self.assertEqual(results[0], results[1])
+
+    def test_Watcher_classes(self):
+        """ Watchers report a burst of writes as a single update """
+        filename = self.tmp_file + "_watch"
+        open(filename, "w").close()
+        for backend in Unitframe.CFG_WATCHERS[1:]:
+            f = Unitframe(filename + " -watcher " + backend)
+            try:
+                watcher = f.create_watcher([filename])
+            except OSError:
+                # inotify is not available on this platform
+                continue
+            self.assertEqual(watcher.wait(timeout=0.1), [])
+            time.sleep(0.05)
+            for i in range(3):
+                with open(filename, "w") as fh:
+                    fh.write(str(i))
+            modified = watcher.wait(timeout=2)
+            self.assertEqual(list(map(os.path.abspath, modified)),
+                             [os.path.abspath(filename)])
+            self.assertEqual(watcher.wait(timeout=0.2), [])
+
+            # Files added later are watched in their own directories
+            other = os.path.join(self.test_area, backend, "other")
+            os.makedirs(os.path.dirname(other), exist_ok=True)
+            open(other, "w").close()
+            watcher.set_files([other])
+            time.sleep(0.05)
+            with open(filename, "w") as fh:
+                fh.write("not watched")
+            with open(other, "w") as fh:
+                fh.write("watched")
+            modified = watcher.wait(timeout=2)
+            self.assertEqual(list(map(os.path.abspath, modified)),
+                             [os.path.abspath(other)])
+            watcher.close()
+
+    def test_file_dependencies(self):
+        """ Local imports and quoted includes """
+        deps_dir = self.test_area + "/deps"
+        os.makedirs(deps_dir + "/pkg", exist_ok=True)
+        files = {
+            "main.py": "import os, helper as h\nfrom pkg import mod\n",
+            "helper.py": "from . import main\n",
+            "pkg/__init__.py": "",
+            "pkg/mod.py": "from .. import helper\n",
+            "main.cc": "#include <vector>\n#include \"main.h\"\n",
+            "main.h": "#include \"missing.h\"\n"}
+        for name, text in files.items():
+            with open(os.path.join(deps_dir, name), "w") as fh:
+                fh.write(text)
+        path = functools.partial(os.path.join, deps_dir)
+        self.assertEqual(file_dependencies(path("main.py")), [
+            path("helper.py"), path("pkg", "__init__.py"),
+            path("pkg", "mod.py")])
+        self.assertEqual(file_dependencies(path("helper.py")),
+                         [path("main.py")])
+        self.assertEqual(file_dependencies(path("pkg", "mod.py")),
+                         [path("helper.py")])
+        self.assertEqual(file_dependencies(path("main.cc")),
+                         [path("main.h")])
+        self.assertEqual(file_dependencies(path("main.h")), [])
+        self.assertEqual(file_dependencies(path("none.py")), [])
+
+        # Transitive graph is updated as the imports change
+        graph = DependencyGraph(path("main.py"))
+        self.assertEqual(graph.files, [
+            path("helper.py"), path("main.py"), path("pkg", "__init__.py"),
+            path("pkg", "mod.py")])
+        self.assertFalse(graph.update())
+        with open(path("pkg", "mod.py"), "w") as fh:
+            fh.write("import os\n")
+        # Helper is still imported by main
+        self.assertFalse(graph.update())
+        self.assertEqual(graph.deps[path("pkg", "mod.py")][1], [])
+        with open(path("main.py"), "w") as fh:
+            fh.write("import pkg.mod\n")
+        self.assertTrue(graph.update())
+        self.assertEqual(graph.files, [
+            path("main.py"), path("pkg", "__init__.py"),
+            path("pkg", "mod.py")])
+        graph = DependencyGraph(path("main.cc"))
+        self.assertEqual(graph.files, [path("main.cc"), path("main.h")])
+
+    def test_user_cache_dir(self):
+        """ Cache directory and compiler version helpers """
+        path = user_cache_dir("ut")
+        self.assertTrue(os.path.isdir(path))
+        self.assertEqual(path, os.path.join(
+            self.test_area, "cache", "unitframe", "ut"))
+        self.assertEqual(compiler_version("no_such_compiler_ut"), "")
+
+    def test_BuildCache_class(self):
+        """ Compilation cache hits, warnings replay and eviction """
+        if not compiler_version("g++"):
+            return
+        cache = BuildCache(cache_dir=self.test_area + "/build",
+                           link_dir=self.test_area + "/bin")
+        os.makedirs(cache.link_dir, exist_ok=True)
+        source = self.tmp_file + "_build.cc"
+        binary = self.test_area + "/bin/build"
+        with open(source, "w") as fh:
+            fh.write("int main() { int unused; return 3; }\n")
+        options = ["-Wall"]
+        status, output, path = cache.build(source, options, binary)
+        self.assertEqual((status, path, cache.hits), (0, binary, 0))
+        self.assertIn("unused", output)
+        self.assertEqual(subprocess.call([binary]), 3)
+
+        # Comment only change is a hit, warnings are replayed
+        with open(source, "a") as fh:
+            fh.write("// Comment\n")
+        self.assertEqual(cache.build(source, options, binary),
+                         (0, output, binary))
+        self.assertEqual(cache.hits, 1)
+
+        # A hit keeps the warnings log with its entry, both are evicted as one
+        status, other_output, other = cache.build(source, ["-O1"])
+        entry = os.path.join(cache.cache_dir, sorted(
+            name for name in os.listdir(cache.cache_dir)
+            if name.endswith(".log"))[0][:-len(".log")])
+        for name in os.listdir(cache.cache_dir):
+            os.utime(os.path.join(cache.cache_dir, name), (1000, 1000))
+        os.utime(other, (2000, 2000))
+        self.assertEqual(cache.build(source, options, binary),
+                         (0, output, binary))
+        cache.size = os.path.getsize(entry) + os.path.getsize(entry + ".log")
+        cache.evict()
+        self.assertEqual(sorted(os.listdir(cache.cache_dir)), sorted([
+            os.path.basename(entry), os.path.basename(entry) + ".log"]))
+        self.assertEqual(cache.build(source, options, binary),
+                         (0, output, binary))
+        self.assertEqual(cache.hits, 3)
+
+        # Different options is a miss, only the latest entry fits the size
+        # and the links to the evicted entries are removed with them
+        cache.size = 1
+        status, output, path = cache.build(source, [])
+        self.assertEqual((status, output, cache.hits), (0, "", 3))
+        self.assertEqual(os.listdir(cache.cache_dir), [os.path.basename(path)])
+        self.assertEqual(subprocess.call([path]), 3)
+        self.assertEqual(os.listdir(cache.link_dir), [])
+
+        # A given key is used as is
+        status, output, path = cache.build(source, [], key="given")
+        self.assertEqual((status, os.path.basename(path)),
+                         (0, "given" + cache.EXE_SUFFIX))
+
+        # Compilation errors are reported and not cached
+        with open(source, "w") as fh:
+            fh.write("int main() { return x; }\n")
+        status, output, path = cache.build(source, options)
+        self.assertNotEqual(status, 0)
+        self.assertEqual(path, None)
+
+    def test_PchCache_class(self):
+        """ Precompiled header is built once per options and used """
+        if not compiler_version("g++"):
+            return
+        pch = PchCache("cstdio", keep=1, cache_dir=self.test_area + "/pch")
+        source = self.tmp_file + "_pch.cc"
+        with open(source, "w") as fh:
+            fh.write("#include <cstdio>\nint main() { return 0; }\n")
+        self.assertTrue(pch.is_used(source))
+        self.assertFalse(pch.is_used(__file__))
+
+        pch_dir = pch.include_dir(["-O0"])
+        gch = os.path.join(pch_dir, "cstdio.gch")
+        mtime = os.path.getmtime(gch)
+        self.assertEqual(pch.include_dir(["-O0"]), pch_dir)
+        self.assertEqual(os.path.getmtime(gch), mtime)
+        self.assertEqual(os.listdir(pch_dir), ["cstdio.gch"])
+        proc = subprocess.run(
+            ["g++", "-O0", "-H", "-I", pch_dir, "-fsyntax-only", source],
+            stderr=subprocess.PIPE)
+        self.assertIn("! " + gch, proc.stderr.decode())
+
+        # Options change invalidates the header, old one is evicted
+        other_dir = pch.include_dir(["-O1"])
+        self.assertNotEqual(other_dir, pch_dir)
+        self.assertEqual(os.listdir(pch.cache_dir),
+                         [os.path.basename(other_dir)])
+
+    def test_pep8_parallel_jobs(self):
+        """ PEP8 parallel checks report the same as serial ones """
+        lint_dir = self.test_area + "/lint"
+        os.makedirs(lint_dir + "/sub", exist_ok=True)
+        for name, text in (("a.py", "x=1\n"), ("sub/b.py", "y = 1 \n"),
+                           ("sub/c.py", "import os, sys\n")):
+            with open(os.path.join(lint_dir, name), "w") as fh:
+                fh.write(text)
+        outputs = []
+        for jobs in ("1", "2"):
+            proc = subprocess.run(
+                [sys.executable, "-W", "ignore",
+                 os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              "checks", "pep8.py"),
+                 "--jobs", jobs, "--statistics", lint_dir],
+                stdout=subprocess.PIPE)
+            outputs.append((proc.returncode, proc.stdout.decode()))
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(outputs[0][0], 1)
+        self.assertEqual(outputs[0][1].count(lint_dir), 3)
+
+    def test_StressTester_class(self):
+        """ Stress testing against a brute-force solution """
+        stress_dir = self.test_area + "/stress"
+        os.makedirs(stress_dir, exist_ok=True)
+        files = {
+            "gen.py": "import random\nn = random.randint(1, 9)\n" +
+                      "print(n)\nprint(*[random.randint(-5, 5) " +
+                      "for i in range(n)])\n",
+            "brute.py": "input()\na = list(map(int, input().split()))\n" +
+                        "print(max(sum(a[i:j]) for i in range(len(a)) " +
+                        "for j in range(i + 1, len(a) + 1)))\n",
+            "good.py": "import sys\nn, *a = map(int, sys.stdin.read()." +
+                       "split())\nbest = cur = a[0]\nfor x in a[1:]:\n" +
+                       "    cur = max(x, cur + x)\n" +
+                       "    best = max(best, cur)\nprint(best)\n",
+            "bad.py": "import sys\nn, *a = map(int, sys.stdin.read()." +
+                      "split())\nprint(max(0, max(a)))\n",
+            "error.py": "raise SystemExit(3)\n"}
+        for name, text in files.items():
+            with open(os.path.join(stress_dir, name), "w") as fh:
+                fh.write(text)
+        gen, brute, good, bad, error = [
+            os.path.join(stress_dir, name) for name in files]
+
+        for jobs in (1, 2):
+            tester = StressTester([gen, brute, good], [], jobs=jobs)
+            self.assertIsNone(tester.prepare())
+            self.assertEqual(tester.run(300)[:2], ([], 300))
+            tester = StressTester([gen, brute, bad], [], jobs=jobs)
+            tester.prepare()
+            failures, count, elapsed = tester.run(10000)
+            self.assertEqual(count, StressTester.BATCH * jobs)
+            for seed, stdin, expected, actual in failures:
+                self.assertEqual(tester.run_case(seed)[1], stdin)
+                self.assertNotEqual(expected.split(), actual.split())
+        tester = StressTester([gen, brute, error], [])
+        tester.prepare()
+        self.assertEqual(tester.run(1)[0][0][3], b"")
+
+        # Shortest failing input is printed
+        f = Unitframe(bad + " -stress " + gen + " " + brute)
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            self.assertEqual(f.stress(), 1)
+        self.assertIn("Stress: MISMATCH on case ", out.getvalue())
+        self.assertIn("Input:\n1\n", out.getvalue())
+        f = Unitframe(good + " -stress " + gen + " " + brute + " -cases 50")
+        with contextlib.redirect_stdout(out):
+            self.assertEqual(f.stress(), 0)
+        self.assertIn("Stress: 50 cases passed in ", out.getvalue())
+
+    def test_Profiler_class(self):
+        """ Hot functions of the time limit scenario """
+        if not hasattr(os, "fork"):
+            return
+        proj = self.tmp_file + "_profile.py"
+        with open(proj, "w") as fh:
+            fh.write("import unittest\n" +
+                     "def hot(n):\n    return sum(i * i for i in range(n))\n" +
+                     "class unitTests(unittest.TestCase):\n" +
+                     "    def time_limit_test(self, nmax):\n" +
+                     "        hot(nmax)\n        self.assertTrue(False)\n")
+        profiler = Profiler(20000, [], top=3)
+        error, stats = profiler.profile(proj)
+        self.assertIsNone(error)
+        label = "hot (" + os.path.basename(proj) + ":2)"
+        self.assertGreaterEqual(stats[label][0], stats[label][1])
+        self.assertIn(label, profiler.report(stats))
+        report = profiler.report(stats)
+        self.assertIn("+0.000s " + label, report)
+        self.assertEqual(report.count("Profile: top 3 by "), 2)
+        self.assertEqual(len(report.splitlines()), 9)
+
+        # Projects which can't be loaded report an error
+        with open(proj, "w") as fh:
+            fh.write("raise ImportError\n")
+        self.assertEqual(profiler.profile(proj)[1], None)
+
+        # C++ projects are profiled with gprof
+        if not shutil.which("gprof"):
+            return
+        proj = self.tmp_file + "_profile.cc"
+        with open(proj, "w") as fh:
+            fh.write("#include <iostream>\n" +
+                     "long hot(long n) { long s = 0;\n" +
+                     "    for (long i = 0; i < n; i++) s += i % 7;\n" +
+                     "    return s; }\n" +
+                     "int main(int argc, char *argv[]) {\n" +
+                     "    std::cout << hot(argc * 1000000L); }\n")
+        error, stats = Profiler(0, ["-O0"]).profile(proj, ["x"])
+        self.assertIsNone(error)
+        self.assertIn("hot(long)", stats)
+
+    def test_PyWorker_class(self):
+        """ Persistent worker runs tests and restarts when polluted """
+        if not hasattr(os, "fork"):
+            return
+        log = self.tmp_file + "_worker.log"
+        proj = self.tmp_file + "_worker.py"
+        with open(log, "w") as output:
+            worker = PyWorker(output.fileno())
+            for result in ("1, 1", "1, 2"):
+                with open(proj, "w") as fh:
+                    fh.write("import unittest\n" +
+                             "class unitTests(unittest.TestCase):\n" +
+                             "    def test_worker(self):\n" +
+                             "        self.assertEqual(" + result + ")\n")
+                self.assertEqual(worker.run(proj), result != "1, 1")
+            pid = worker.pid
+
+            # Project arguments are passed in sys.argv
+            with open(proj, "w") as fh:
+                fh.write("import sys, unittest\n" +
+                         "class unitTests(unittest.TestCase):\n" +
+                         "    def test_args(self):\n" +
+                         "        self.assertEqual(sys.argv[1:], " +
+                         "['-ut', 'a', 'b'])\n")
+            self.assertEqual(worker.run(proj, ["a", "b"]), 0)
+            self.assertEqual(worker.run(proj), 1)
+            self.assertEqual(worker.pid, pid)
+
+            # Importing a project helper module forces a fresh worker
+            with open(self.tmp_file + "_helper.py", "w") as fh:
+                fh.write("\n")
+            with open(proj, "w") as fh:
+                fh.write("import " + os.path.basename(self.tmp_file) +
+                         "_helper\n")
+            self.assertEqual(worker.run(proj), 0)
+            self.assertEqual(worker.pid, None)
+            self.assertEqual(worker.run(proj), 0)
+            self.assertNotEqual(worker.pid, pid)
+
+            # Previously failed tests run first and stop at the first failure
+            with open(proj, "w") as fh:
+                fh.write("import unittest\n" +
+                         "class unitTests(unittest.TestCase):\n" +
+                         "    def test_a(self):\n        pass\n" +
+                         "    def test_b(self):\n        self.fail()\n" +
+                         "    def test_c(self):\n        pass\n")
+            self.assertEqual(worker.run(proj), 1)
+            test_id = "__uframe_project__.unitTests."
+            self.assertEqual(worker.failed, [test_id + "test_b"])
+            self.assertEqual(sorted(worker.durations),
+                             [test_id + t for t in ("test_a", "test_b",
+                                                    "test_c")])
+            output.flush()
+            size = os.path.getsize(log)
+            self.assertEqual(worker.run(proj), 1)
+
+            # The cleanup test runs last, after the failed first run too
+            with open(proj, "w") as fh:
+                fh.write("import unittest\n" +
+                         "class unitTests(unittest.TestCase):\n" +
+                         "    ran = []\n" +
+                         "    def test_a(self):\n" +
+                         "        self.ran.append('a')\n" +
+                         "    def test_b(self):\n" +
+                         "        self.ran.append('b')\n" +
+                         "        self.fail()\n" +
+                         "    def test_xcleanup(self):\n" +
+                         "        self.assertEqual(sorted(self.ran), " +
+                         "['a', 'b'])\n")
+            for i in range(2):
+                self.assertEqual(worker.run(proj), 1)
+                self.assertEqual(worker.failed, [test_id + "test_b"])
+            worker.stop()
+        with open(log) as fh:
+            text = fh.read()
+        self.assertIn("FAILED (failures=1)", text)
+        self.assertIn("\nFailed first: running the remaining 2 tests\n",
+                      text[size:])
+        self.assertEqual(text[size:].index("F"), 0)
+
+        # Failed tests from the fastest, the others in order, cleanup last
+        tests = [unittest.FunctionTestCase(str, description="m.test_" + name)
+                 for name in ("a", "xcleanup", "b", "c", "d")]
+        for test in tests:
+            test.id = test.shortDescription
+        self.assertEqual(
+            [test.id()[7:] for test in worker.order(
+                tests, ["m.test_xcleanup", "m.test_d", "m.test_b"],
+                {"m.test_a": 1., "m.test_b": 3., "m.test_d": 2.})],
+            ["d", "b", "a", "c", "xcleanup"])
+
+    def test_Canceller_class(self):
+        """ Cancelled runs kill the process groups of their children """
+        if not hasattr(os, "killpg"):
+            return
+        canceller = Canceller()
+        timer = threading.Timer(0.2, canceller.cancel)
+        timer.start()
+        start = time.time()
+        status, stdout, usage = run_child(
+            ["sh", "-c", "sleep 10 & echo started; wait"], canceller)
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual((status, stdout), (-signal.SIGKILL, b"started\n"))
+        self.assertEqual(canceller.pids, set())
+
+        # Children started after the cancellation are killed right away
+        self.assertEqual(run_child(["sleep", "10"], canceller)[0],
+                         -signal.SIGKILL)
+        canceller.reset()
+        self.assertEqual(run_child(["true"], canceller)[0], 0)
+
+        # Unit test command and the worker are cancelled
+        f = Unitframe(self.tmp_file + "_cancel.py")
+        timer = threading.Timer(0.2, f.canceller.cancel)
+        timer.start()
+        self.assertEqual(f.run_cmd("sleep 10"), -signal.SIGKILL)
+        self.assertTrue(f.is_cancelled())
+        f.canceller.reset()
+        proj = self.tmp_file + "_cancel.py"
+        with open(proj, "w") as fh:
+            fh.write("import time, unittest\n" +
+                     "class unitTests(unittest.TestCase):\n" +
+                     "    def test_sleep(self):\n" +
+                     "        time.sleep(10)\n")
+        with open(os.devnull, "w") as output:
+            worker = PyWorker(output.fileno(), f.canceller)
+            timer = threading.Timer(0.5, f.canceller.cancel)
+            timer.start()
+            start = time.time()
+            self.assertEqual(worker.run(proj), 1)
+            self.assertLess(time.time() - start, 5)
+            self.assertEqual(worker.pid, None)
+
     def test_xcleanup(self):
-        shutil.rmtree(self.tmp_area)
+        shutil.rmtree(self.test_area)
 
 if __name__ == '__main__':
     if sys.argv[-1] == "-ut":